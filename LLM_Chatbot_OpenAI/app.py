@@ -1,6 +1,15 @@
 import openai
 import streamlit as st
-from utils import call_gpt4, get_system_prompt, generate_feature_prompt
+import time
+from utils import stream_gpt4, get_system_prompt, generate_feature_prompt, GPT4_MODEL, GPT4_TEMPERATURE, KNOWITALL_SYSTEM_PROMPT
+from cache import ResponseCache, make_cache_key, CACHEABLE_FEATURES
+
+
+@st.cache_resource
+def get_response_cache():
+    """One cache handle per server process; the SQLite file is shared between processes."""
+    return ResponseCache()
+
 
 # App Title
 st.title("KnowItAll Chatbot 🤖")
@@ -54,18 +63,52 @@ else:
             system_prompt = get_system_prompt(feature)
             tailored_prompt = generate_feature_prompt(feature, user_input)
             
-            # Call GPT-4 using the tailored prompt and user's API key
-            response = call_gpt4(prompt=tailored_prompt, api_key=st.session_state["api_key"])
-            
             # **Output Display**
             # Display the GPT-4 response under a subheader
             st.subheader(f"Output for '{feature}':")
-            if feature == "Write Code":
-                # Show the output as a code block for the "Write Code" feature
-                st.code(response, language="python")
+            output = st.empty()  # Re-rendered as each piece of the response arrives
+
+            def show(text):
+                if feature == "Write Code":
+                    # Show the output as a code block for the "Write Code" feature
+                    output.code(text, language="python")
+                else:
+                    # Show the output as plain text for other features
+                    output.write(text)
+
+            # Features with deterministic inputs are answered from the response cache when possible.
+            # The key uses the system message stream_gpt4 actually sends.
+            cache_key = None
+            cached_response = None
+            if feature in CACHEABLE_FEATURES:
+                start_time = time.perf_counter()
+                cache_key = make_cache_key(
+                    feature, KNOWITALL_SYSTEM_PROMPT, tailored_prompt, GPT4_MODEL, GPT4_TEMPERATURE
+                )
+                cached_response = get_response_cache().get(cache_key)
+                lookup_ms = (time.perf_counter() - start_time) * 1000
+
+            if cached_response is not None:
+                show(cached_response)
+                st.caption(f"Served from cache in {lookup_ms:.1f} ms")
             else:
-                # Show the output as plain text for other features
-                st.write(response)
+                # Stream GPT-4's response to the tailored prompt using the user's API key
+                response = ""
+                stats = {}
+                for delta in stream_gpt4(prompt=tailored_prompt, api_key=st.session_state["api_key"], stats=stats):
+                    response += delta
+                    show(response)
+
+                # Only complete responses are cached, never errors
+                if cache_key is not None and "error" not in stats:
+                    get_response_cache().put(cache_key, feature, response)
+
+                # Report how quickly the response started and how fast it was generated
+                st.caption(
+                    f"First token after {stats['ttft']:.2f}s · "
+                    f"{stats['tokens']} tokens at {stats['tokens_per_second']:.1f} tokens/s · "
+                    f"{stats['total']:.2f}s total"
+                )
         else:
             # Display a warning if the user input is empty
             st.warning("Please enter some input.")
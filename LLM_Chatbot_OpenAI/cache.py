@@ -0,0 +1,116 @@
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+
+# Features whose output depends only on the input, so a stored response can be served again
+CACHEABLE_FEATURES = {"Ask a Question", "Translate Text"}
+
+
+def make_cache_key(feature, system_prompt, prompt, model, temperature):
+    """
+    Builds the cache key for a request.
+
+    Parameters:
+        feature (str): The feature selected by the user (e.g., "Translate Text").
+        system_prompt (str): The system message sent with the request (KNOWITALL_SYSTEM_PROMPT).
+        prompt (str): The tailored prompt, from generate_feature_prompt.
+        model (str): The OpenAI model name.
+        temperature (float): The sampling temperature.
+
+    Returns:
+        str: A SHA-256 hex digest identifying the request.
+    """
+    payload = json.dumps([feature, system_prompt, prompt, model, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent cache of GPT-4 responses stored in a SQLite database.
+
+    Every operation opens its own connection, and the database runs in WAL mode with a busy
+    timeout. This lets the Streamlit session threads and several server processes share one cache
+    file. Entries expire after `ttl_seconds`. When the stored responses exceed `max_bytes`, the
+    least recently used ones are evicted.
+    """
+
+    def __init__(self, path="response_cache.sqlite3", ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                       key TEXT PRIMARY KEY,
+                       feature TEXT NOT NULL,
+                       response TEXT NOT NULL,
+                       size INTEGER NOT NULL,
+                       created REAL NOT NULL,
+                       accessed REAL NOT NULL
+                   )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        # The timeout makes concurrent writers wait for the lock instead of failing
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """
+        Looks up a cached response and marks it as recently used.
+
+        Parameters:
+            key (str): A key from make_cache_key.
+
+        Returns:
+            str: The cached response, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl_seconds < now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key, feature, response):
+        """
+        Stores a response, then drops expired entries and evicts the least recently used ones
+        while the cache is larger than `max_bytes`.
+
+        Parameters:
+            key (str): A key from make_cache_key.
+            feature (str): The feature the response was generated for.
+            response (str): The complete GPT-4 response.
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, feature, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, feature, response, size, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = []
+                for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_key,))
+                    total -= old_size
+                conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
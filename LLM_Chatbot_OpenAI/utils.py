@@ -1,4 +1,37 @@
-import openai
+import time
+import hashlib
+import threading
+from openai import OpenAI
+
+GPT4_MODEL = "gpt-4"
+GPT4_TEMPERATURE = 1.0  # OpenAI's default, stated explicitly so it can be part of cache keys
+KNOWITALL_SYSTEM_PROMPT = "You are a helpful assistant called KnowItAll."  # Sent with every request
+
+# One client per API key, shared by the Streamlit session threads
+_clients = {}
+_client_lock = threading.Lock()
+
+
+def get_openai_client(api_key):
+    """
+    Returns the OpenAI client for an API key, creating it on first use.
+
+    Each session's requests are authenticated with its own key, instead of a module-wide
+    openai.api_key that concurrent sessions would overwrite. The client keeps its HTTP
+    connections alive between requests.
+
+    Parameters:
+        api_key (str): The API key required to authenticate with OpenAI.
+
+    Returns:
+        OpenAI: The client for this key.
+    """
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()  # don't keep raw keys as dict keys
+    with _client_lock:
+        if key not in _clients:
+            _clients[key] = OpenAI(api_key=api_key)
+        return _clients[key]
+
 # Function to call GPT-4 API
 def call_gpt4(prompt, api_key):
     """
@@ -16,14 +49,12 @@ def call_gpt4(prompt, api_key):
              In case of an error, an error message is returned as a string.
     """
     try:
-        # Set the OpenAI API key
-        openai.api_key = api_key
-
-        # Call the GPT-4 API with the provided prompt
-        response = openai.chat.completions.create(
-            model="gpt-4",  # Specify the GPT-4 model
+        # Call the GPT-4 API with the provided prompt, using the client for this API key
+        response = get_openai_client(api_key).chat.completions.create(
+            model=GPT4_MODEL,  # Specify the GPT-4 model
+            temperature=GPT4_TEMPERATURE,
             messages=[
-                {"role": "system", "content": "You are a helpful assistant called KnowItAll."},  # System message to guide the AI's behavior
+                {"role": "system", "content": KNOWITALL_SYSTEM_PROMPT},  # System message to guide the AI's behavior
                 {"role": "user", "content": prompt},  # User's input
             ],
         )
@@ -35,6 +66,70 @@ def call_gpt4(prompt, api_key):
         return f"Error: {e}"
 
 
+
+# Streaming variant of call_gpt4
+def stream_gpt4(prompt, api_key, stats=None):
+    """
+    Sends a prompt to the GPT-4 API and yields the response as it is generated.
+
+    Uses the same model and system prompt as call_gpt4, but with streaming enabled, so the
+    caller can render each piece of text as soon as it arrives instead of waiting for the whole
+    completion. Timing information is printed to the console and, if a dictionary is passed as
+    `stats`, stored in it once the stream ends.
+
+    Parameters:
+        prompt (str): The user input or prompt to be processed by GPT-4.
+        api_key (str): The API key required to authenticate with OpenAI.
+        stats (dict, optional): Filled with "ttft" (seconds until the first token),
+            "tokens" (number of streamed tokens), "tokens_per_second" (generation speed
+            after the first token), "total" (seconds for the whole request) and, if the
+            request failed, "error".
+
+    Yields:
+        str: Consecutive pieces of GPT-4's response. In case of an error, an error
+             message is yielded as the last piece.
+    """
+    stats = {} if stats is None else stats
+    start_time = time.perf_counter()
+    first_token_time = None
+    tokens = 0
+    try:
+        # Call the GPT-4 API with streaming enabled, using the client for this API key
+        stream = get_openai_client(api_key).chat.completions.create(
+            model=GPT4_MODEL,
+            temperature=GPT4_TEMPERATURE,
+            messages=[
+                {"role": "system", "content": KNOWITALL_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            stream=True,
+        )
+
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            tokens += 1  # each streamed chunk carries one token
+            yield delta
+    except Exception as e:
+        # Handle exceptions and yield the error message after any partial output
+        stats["error"] = str(e)
+        yield f"\n\nError: {e}" if tokens else f"Error: {e}"
+    finally:
+        end_time = time.perf_counter()
+        stats["tokens"] = tokens
+        stats["total"] = end_time - start_time
+        stats["ttft"] = (first_token_time or end_time) - start_time
+        generation_time = end_time - first_token_time if first_token_time else 0
+        stats["tokens_per_second"] = tokens / generation_time if generation_time > 0 else 0.0
+        print(
+            f"GPT-4 stream: first token after {stats['ttft']:.2f}s, "
+            f"{tokens} tokens at {stats['tokens_per_second']:.1f} tokens/s, {stats['total']:.2f}s total"
+        )
+
+
 # Predefined System Prompts
 def get_system_prompt(feature):
     """
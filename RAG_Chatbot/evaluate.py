@@ -0,0 +1,240 @@
+"""
+Offline evaluation and load test for the Constitution QA pipeline.
+
+Runs a fixed question set with reference article numbers through the same
+retrieval stack as app.py (RecursiveCharacterTextSplitter -> Qdrant with
+FastEmbed -> FlashrankRerank -> prompt -> LLM), with ChatGroq replaced by a
+local stub so no API key or network access is needed. Reports recall@k and
+MRR against the reference articles, per-stage latency percentiles and
+queries per second under N concurrent clients.
+
+The document is read from the markdown that app.py saves after LlamaParse
+(/tmp/parsed_const_document.md by default), and the FastEmbed and Flashrank
+models must already be in the local model cache.
+
+Usage:
+    python evaluate.py --questions eval_questions.json --clients 4
+    python evaluate.py --chunk-size 1024 --chunk-overlap 64 --k 8 --no-rerank
+"""
+import argparse
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.prompts import PromptTemplate
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import Qdrant
+from langchain.retrievers.document_compressors import FlashrankRerank
+from langchain_community.document_loaders import UnstructuredMarkdownLoader
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+from langchain_core.language_models.llms import LLM
+
+# Same prompt as app.py so the LLM stage sees realistic input sizes
+PROMPT_TEMPLATE = """
+Use the following pieces of information to answer the user's question.
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+Context: {context}
+Question: {question}
+
+Answer the question and provide additional helpful information,
+based on the pieces of information, if applicable. Be succinct.
+
+Responses should be properly formatted to be easily read.
+"""
+
+# Article headings in the parsed markdown start a line with "Article 27" or "27. Equality and ...".
+# References inside the text ("subject to Article 24", "Article 33(1)") must not match.
+ARTICLE_HEADING_PATTERN = re.compile(
+    r"^[#*\s]*(?:Article\s+(\d{1,3})(?![\d(])|(\d{1,3})\.\s+[A-Z])", re.IGNORECASE | re.MULTILINE
+)
+
+STAGES = ["retrieve", "rerank", "llm", "total"]
+
+
+class StubLLM(LLM):
+    """Local stand-in for ChatGroq that sleeps for a fixed latency and echoes the question."""
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        question = prompt.rsplit("Question:", 1)[-1].split("\n", 1)[0].strip()
+        return f"Stub answer for: {question}"
+
+
+def article_spans(text):
+    """
+    Returns (start, end, article number) for each article of the full document text.
+
+    Articles appear in increasing order, so a heading-like line whose number is not larger than
+    the previous article's (a numbered list in a schedule, say) is treated as part of that article.
+    """
+    headings = []
+    for match in ARTICLE_HEADING_PATTERN.finditer(text):
+        number = int(match.group(1) or match.group(2))
+        if not headings or number > headings[-1][1]:
+            headings.append((match.start(), number))
+    ends = [start for start, _ in headings[1:]] + [len(text)]
+    return [(start, end, str(number)) for (start, number), end in zip(headings, ends)]
+
+
+def extract_articles(spans, start, length):
+    """Returns the set of article numbers (as strings) whose spans overlap a chunk's offsets."""
+    end = start + length
+    return {article for span_start, span_end, article in spans if span_start < end and start < span_end}
+
+
+def load_questions(path):
+    """Loads a list of {"question": ..., "articles": [...]} entries."""
+    with open(path, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    for item in questions:
+        item["articles"] = {str(article) for article in item["articles"]}
+    return questions
+
+
+def build_pipeline(args):
+    loader = UnstructuredMarkdownLoader(args.document)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, add_start_index=True
+    )
+    # Label each chunk with the articles its offsets fall in, not the ones its text mentions,
+    # so cross-references and continuations past a heading don't skew the chunk_size comparison
+    docs = []
+    for document in loader.load():
+        spans = article_spans(document.page_content)
+        for chunk in text_splitter.split_documents([document]):
+            articles = extract_articles(spans, chunk.metadata["start_index"], len(chunk.page_content))
+            chunk.metadata["articles"] = sorted(articles, key=int)
+            docs.append(chunk)
+    print(f"Split document into {len(docs)} chunks")
+
+    embeddings = FastEmbedEmbeddings(model_name=args.embedding_model)
+    start_time = time.perf_counter()
+    qdrant = Qdrant.from_documents(docs, embeddings, location=":memory:", collection_name="evaluation")
+    print(f"Indexed chunks in {time.perf_counter() - start_time:.2f} seconds")
+
+    retriever = qdrant.as_retriever(search_kwargs={"k": args.k})
+    compressor = None if args.no_rerank else FlashrankRerank(model=args.rerank_model, top_n=args.top_n)
+    prompt = PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["context", "question"])
+    llm = StubLLM(latency=args.llm_latency)
+    return retriever, compressor, prompt, llm
+
+
+def run_query(pipeline, item):
+    """Runs one question through every stage and returns its timings and ranked articles."""
+    retriever, compressor, prompt, llm = pipeline
+    query = item["question"]
+    timings = {}
+
+    start_time = time.perf_counter()
+    retrieved_docs = retriever.invoke(query)
+    timings["retrieve"] = time.perf_counter() - start_time
+
+    stage_start = time.perf_counter()
+    if compressor is not None:
+        final_docs = list(compressor.compress_documents(retrieved_docs, query))
+    else:
+        final_docs = retrieved_docs
+    timings["rerank"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    context = "\n\n".join(doc.page_content for doc in final_docs)
+    llm.invoke(prompt.format(context=context, question=query))
+    timings["llm"] = time.perf_counter() - stage_start
+    timings["total"] = time.perf_counter() - start_time
+
+    return {
+        "timings": timings,
+        "retrieved": [set(doc.metadata["articles"]) for doc in retrieved_docs],
+        "final": [set(doc.metadata["articles"]) for doc in final_docs],
+    }
+
+
+def recall_at_k(ranked_articles, reference, k):
+    found = set().union(*ranked_articles[:k]) if ranked_articles[:k] else set()
+    return len(found & reference) / len(reference)
+
+
+def reciprocal_rank(ranked_articles, reference):
+    for rank, articles in enumerate(ranked_articles, start=1):
+        if articles & reference:
+            return 1.0 / rank
+    return 0.0
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(questions, results, wall_time, args):
+    print("\n=== Retrieval quality ===")
+    # The reranker keeps only its top_n documents, so the final row is cut off there
+    cutoffs = {"retrieved": args.k, "final": args.k if args.no_rerank else min(args.k, args.top_n)}
+    for label, k in cutoffs.items():
+        recalls = [recall_at_k(r[label], q["articles"], k) for q, r in zip(questions, results)]
+        mrrs = [reciprocal_rank(r[label], q["articles"]) for q, r in zip(questions, results)]
+        print(
+            f"{label:>9}: recall@{k} = {sum(recalls) / len(recalls):.3f}  "
+            f"MRR = {sum(mrrs) / len(mrrs):.3f}"
+        )
+
+    print("\n=== Latency (ms) ===")
+    print(f"{'stage':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage in STAGES:
+        values = [r["timings"][stage] * 1000 for r in results]
+        print(
+            f"{stage:>9} {percentile(values, 50):9.1f} "
+            f"{percentile(values, 95):9.1f} {percentile(values, 99):9.1f}"
+        )
+
+    print("\n=== Throughput ===")
+    print(f"{len(results)} queries from {args.clients} concurrent clients in {wall_time:.2f} s")
+    print(f"QPS: {len(results) / wall_time:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation of the Constitution QA pipeline")
+    parser.add_argument("--document", default="/tmp/parsed_const_document.md")
+    parser.add_argument("--questions", default="eval_questions.json")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--chunk-overlap", type=int, default=128)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embedding-model", default="BAAI/bge-base-en-v1.5")
+    parser.add_argument("--rerank-model", default="ms-marco-MiniLM-L-12-v2")
+    parser.add_argument("--top-n", type=int, default=3, help="Documents Flashrank keeps after reranking")
+    parser.add_argument("--no-rerank", action="store_true", help="Skip the Flashrank reranking stage")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM sleeps per call")
+    parser.add_argument("--clients", type=int, default=1, help="Number of concurrent clients")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each client replays the question set")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        parser.error(f"{args.questions} contains no questions")
+    pipeline = build_pipeline(args)
+
+    # Warm up the embedding and reranking models so the first query doesn't skew latencies
+    run_query(pipeline, questions[0])
+
+    workload = questions * args.repeat * args.clients
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(lambda item: run_query(pipeline, item), workload))
+    wall_time = time.perf_counter() - start_time
+
+    report(workload, results, wall_time, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,62 @@
 import streamlit as st
 import os
-from data_handler import DataHandler
-from utils import build_prompt, get_openai_response
 import time
+import threading
+from data_handler import DataHandler
+from utils import build_prompt, stream_openai_response, format_references, format_response_with_references
 
 # Data loading and setup
-data_path = "output/faqs.json"  # Replace with your actual path
+data_path = "output/faqs.jsonl"  # Replace with your actual path (JSON arrays work too)
 persist_directory = "./chroma_db"
-# Instantiate DataHandler without tenant/database parameters
-data_handler = DataHandler(data_path, persist_directory=persist_directory)
-
-# Initialize collection in session state if it doesn't exist
-if "collection" not in st.session_state:
-    # Check if the collection exists. If not, create it
-    try:
-        data_handler.chroma_client.get_collection(name=data_handler.collection_name)  # we try to get it
-        print("Collection exists")
-        with st.spinner("Deleting old collection"):
-            data_handler.delete_chroma_collection()  # we delete it
-            time.sleep(1)  # we wait
-        print("Collection deleted")
-        print(f"Collection does not exist: we need to create it")
-        with st.spinner("Processing data and creating collection..."):
-            collection = data_handler.process_data_and_create_collection()  # we create the collection
-        st.session_state["collection"] = collection
-
-    except Exception as e:  # if we cant, an error is raised
-        print(f"Collection does not exist: {e}. We need to create it")
-        with st.spinner("Processing data and creating collection..."):
-            collection = data_handler.process_data_and_create_collection()  # we create the collection
-        st.session_state["collection"] = collection
+
+
+@st.cache_resource
+def get_data_handler():
+    """
+    Builds the DataHandler once per server process and shares it across all sessions and reruns.
+
+    The embedding model is warmed and the collection is checked (and only rebuilt if its
+    fingerprint changed) here, so a message only pays for the query encode and search.
+    """
+    # Instantiate DataHandler without tenant/database parameters
+    handler = DataHandler(data_path, persist_directory=persist_directory)
+    handler.warm_up()
+    handler.get_or_create_collection()
+    return handler
+
+
+class FastPathStats:
+    """Counts messages answered straight from an FAQ match, and how long those answers took."""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # every session's script thread updates the same counters
+        self.messages = 0
+        self.fast_path = 0
+        self.fast_path_seconds = 0.0
+
+    def record(self, fast_path, seconds=0.0):
+        with self.lock:
+            self.messages += 1
+            if fast_path:
+                self.fast_path += 1
+                self.fast_path_seconds += seconds
+
+    def snapshot(self):
+        """Returns (messages, fast path hits, mean fast path latency in seconds)."""
+        with self.lock:
+            mean = self.fast_path_seconds / self.fast_path if self.fast_path else 0.0
+            return self.messages, self.fast_path, mean
+
+
+@st.cache_resource
+def get_fast_path_stats():
+    """Process-wide fast path statistics, shared by all sessions."""
+    return FastPathStats()
+
+
+with st.spinner("Loading the FAQ collection..."):
+    data_handler = get_data_handler()
+fast_path_stats = get_fast_path_stats()
 
 # Streamlit app
 st.title("Fitness Passport Customer Support Chatbot")
@@ -38,13 +65,13 @@ st.title("Fitness Passport Customer Support Chatbot")
 st.sidebar.header("API Key")
 api_key = st.sidebar.text_input("Enter your OpenAI API key", type="password")
 
-# Set the api key for the session if the user provides it
+# Use the key for this session only, falling back to the server's environment
 if api_key:
-    os.environ["OPENAI_API_KEY"] = api_key
     st.sidebar.success("API key set!")
+openai_api_key = api_key or os.environ.get("OPENAI_API_KEY")
 
 # Check if the API key is set
-if not os.environ.get("OPENAI_API_KEY"):
+if not openai_api_key:
     st.error("Please enter your OpenAI API key in the sidebar.")
     st.stop()  # Stop the app if no API key
 
@@ -60,21 +87,43 @@ if prompt := st.chat_input("What is your question?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # RAG flow
-    with st.spinner("Getting the relevant documents..."):
-        results = data_handler.query_chroma(prompt)  # we get the full results (documents and metadatas)
-        if results["documents"] and results["metadatas"]:  # if there are documents and metadatas
-            retrieved_chunks = results["documents"][0]
-            retrieved_metadatas = results["metadatas"][0]  # we get the metadatas
-        else:
-            retrieved_chunks = []
-            retrieved_metadatas = []
-
-    full_prompt = build_prompt(prompt, retrieved_chunks)
-    with st.spinner("Generating the response..."):
-        response = get_openai_response(full_prompt, retrieved_metadatas)  # we add the metadatas
-
-    # Streamlit display
+    # FAQ fast path: a near-exact paraphrase of a stored question is answered without calling the LLM
+    start_time = time.perf_counter()
+    query_embedding = data_handler.encode_query(prompt)
+    faq_match = data_handler.match_faq(query_embedding)
+    if faq_match:
+        response = format_response_with_references(faq_match["answer"], [{"source": faq_match["question"]}])
+        with st.chat_message("assistant"):
+            st.markdown(response)
+        elapsed = time.perf_counter() - start_time
+        fast_path_stats.record(True, elapsed)
+        print(f"FAQ fast path hit ({faq_match['similarity']:.3f}) in {elapsed * 1000:.0f} ms: {faq_match['question']}")
+    else:
+        fast_path_stats.record(False)
+        # RAG flow
+        with st.spinner("Getting the relevant documents..."):
+            results = data_handler.query_chroma(prompt, query_embedding=query_embedding)  # we get the full results (documents and metadatas)
+            if results["documents"] and results["metadatas"]:  # if there are documents and metadatas
+                retrieved_chunks = results["documents"][0]
+                retrieved_metadatas = results["metadatas"][0]  # we get the metadatas
+            else:
+                retrieved_chunks = []
+                retrieved_metadatas = []
+
+        full_prompt = build_prompt(prompt, retrieved_chunks)
+        with st.chat_message("assistant"):
+            # Stream the answer as it is generated, then add the references once it is complete
+            response_text = st.write_stream(stream_openai_response(full_prompt, openai_api_key))
+            references = format_references(retrieved_metadatas)
+            st.markdown(references)
+        response = response_text + "\n\n" + references
+
     st.session_state.messages.append({"role": "assistant", "content": response})
-    with st.chat_message("assistant"):
-        st.markdown(response)  # we now display the response in markdown
+
+# Share of messages answered from the FAQ fast path (milliseconds, no API cost) across all sessions
+messages, fast_path, fast_path_latency = fast_path_stats.snapshot()
+if messages:
+    st.sidebar.caption(
+        f"FAQ fast path: {fast_path}/{messages} messages ({fast_path / messages:.0%}) "
+        f"answered without the LLM, in {fast_path_latency * 1000:.0f} ms on average"
+    )
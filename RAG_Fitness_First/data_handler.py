@@ -1,103 +1,476 @@
 import chromadb
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import json
 import os
+import hashlib
+import threading
+from contextlib import contextmanager
+from itertools import islice
 from chromadb.config import Settings
 
+# Process-wide registry of the expensive resources, so every DataHandler (and every
+# Streamlit session and rerun) shares one embedding model and one client per directory
+_resource_lock = threading.Lock()
+_embedding_models = {}
+_chroma_clients = {}
+
+# Bump when the set of collections or the record layout changes, so old indexes get rebuilt
+INDEX_LAYOUT_VERSION = 3
+
+
+def get_embedding_model(model_name):
+    """
+    Returns the shared SentenceTransformer for a model name, loading it on first use.
+
+    Args:
+        model_name: The name or local path of the sentence transformer model.
+
+    Returns:
+        The SentenceTransformer instance shared by the whole process.
+    """
+    with _resource_lock:
+        if model_name not in _embedding_models:
+            print(f"Loading embedding model: {model_name}")
+            _embedding_models[model_name] = SentenceTransformer(model_name)
+        return _embedding_models[model_name]
+
+
+def get_chroma_client(persist_directory, settings):
+    """
+    Returns the shared ChromaDB PersistentClient for a directory, creating it on first use.
+
+    Args:
+        persist_directory: The directory ChromaDB persists to.
+        settings: The ChromaDB settings used when the client is first created.
+
+    Returns:
+        The PersistentClient instance shared by the whole process.
+    """
+    key = os.path.abspath(persist_directory)
+    with _resource_lock:
+        if key not in _chroma_clients:
+            # Create a PersistentClient without tenant/database parameters
+            _chroma_clients[key] = chromadb.PersistentClient(path=persist_directory, settings=settings)
+        return _chroma_clients[key]
+
+
+def iter_json_array(f, block_size=1 << 16):
+    """
+    Yields the elements of a top-level JSON array one at a time without loading the whole file.
+
+    Args:
+        f: A text file object positioned at the start of the array.
+        block_size: The number of characters read from the file at a time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(block_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array of FAQ records")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            block = f.read(block_size)
+            if not block:
+                raise  # truncated file
+            buffer += block
+            continue
+        yield record
+        buffer = buffer[end:]
+
+
+def record_id(*parts):
+    """
+    Returns a deterministic ID for a record, so the same FAQ text always maps to the same record
+    no matter where it appears in the export.
+    """
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def batched(iterable, size):
+    """Yields lists of up to size items from an iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
 class DataHandler:
     def __init__(
         self,
         data_path,
         embedding_model_name="/PATH_TO_A_SENTENCE_TRANSFORMER_MODEL/all-MiniLM-L6-v2", #change this  to a local path
         collection_name="fitness_passport_faqs",
-        persist_directory="./chroma_db"
+        persist_directory="./chroma_db",
+        chunk_separator="\n\n",
+        encode_batch_size=64,
+        encode_workers=0,
+        ingest_batch_size=256,
+        faq_match_threshold=0.92
     ):
         self.data_path = data_path
         self.embedding_model_name = embedding_model_name
         self.collection_name = collection_name
+        self.questions_collection_name = f"{collection_name}_questions"  # FAQ question embeddings
         self.persist_directory = persist_directory
+        self.chunk_separator = chunk_separator
+        self.encode_batch_size = encode_batch_size
+        self.encode_workers = encode_workers  # > 1 starts a multi-process encode pool for indexing
+        self.ingest_batch_size = ingest_batch_size  # chunks held in memory at a time while indexing
+        self.faq_match_threshold = faq_match_threshold  # cosine similarity needed to answer straight from an FAQ
         self.settings = Settings(allow_reset=True)
+        self._collection = None  # cached handles, reset whenever the collections are rebuilt or deleted
+        self._questions_collection = None
 
-        # Create a PersistentClient without tenant/database parameters
-        self.chroma_client = chromadb.PersistentClient(
-            path=self.persist_directory,
-            settings=self.settings
-        )
-
-        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        self.chroma_client = get_chroma_client(self.persist_directory, self.settings)
+        self.embedding_model = get_embedding_model(self.embedding_model_name)
         print(f"ChromaDB persist directory: {self.persist_directory}")
 
+    def warm_up(self):
+        """Runs one throwaway encode so the first user query doesn't pay for model initialisation."""
+        self.embedding_model.encode("warm up")
+
     def load_data(self):
-        with open(self.data_path, "r") as f:
-            data = json.load(f)
-        return data
+        """
+        Streams FAQ records from the data file, which can be a JSON array or JSONL (one record per line).
+
+        Yields:
+            One {"question": ..., "answer": ...} dictionary at a time.
+        """
+        with open(self.data_path, "r", encoding="utf-8") as f:
+            if self.data_path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from iter_json_array(f)
 
     def chunk_data(self, data):
-        chunked_data = []
         for item in data:
             question = item["question"]
             answer = item["answer"]
-            paragraphs = answer.split("\n\n")  # Split into paragraphs
+            paragraphs = answer.split(self.chunk_separator)  # Split into paragraphs
             for paragraph in paragraphs:
                 if paragraph:  # Check if paragraph is not empty
-                    chunked_data.append({
-                        "question": question,
-                        "answer_chunk": paragraph.strip(),
-                    })
-        return chunked_data
-
-    def create_embeddings(self, data):
-        data_with_embeddings = []
+                    answer_chunk = paragraph.strip()
+                    yield {
+                        "id": record_id(question, answer_chunk),
+                        "text": answer_chunk,  # what gets embedded
+                        "document": question + "\n" + answer_chunk,
+                        "metadata": {"source": question},
+                    }
+
+    def question_data(self, data):
+        """
+        Turns FAQ records into question records for the fast path: the question is embedded and
+        the full answer is stored as the document.
+        """
         for item in data:
-            chunk_embedding = self.embedding_model.encode(item["answer_chunk"]).tolist()
-            data_with_embeddings.append({
-                "question": item["question"],
-                "answer_chunk": item["answer_chunk"],
-                "answer_chunk_embedding": chunk_embedding
-            })
-        return data_with_embeddings
-
-    def create_chroma_collection(self, data_with_embeddings):
-        metadatas = []  # we create a metadata list
-        for item in data_with_embeddings:  # we append the question to the metadata list
-            metadatas.append({"source": item["question"]})
-
-        collection = self.chroma_client.create_collection(name=self.collection_name)
-        if data_with_embeddings:  # we add this test
-            collection.add(
-                embeddings=[item["answer_chunk_embedding"] for item in data_with_embeddings],
-                documents=[item["question"] + "\n" + item["answer_chunk"] for item in data_with_embeddings],
-                metadatas=metadatas,  # we add the metadatas
-                ids=[f"id{i}" for i in range(len(data_with_embeddings))]
+            yield {
+                "id": record_id(item["question"], item["answer"]),
+                "text": item["question"],
+                "document": item["answer"],
+                "metadata": {"source": item["question"]},
+            }
+
+    @contextmanager
+    def encode_pool(self):
+        """Starts a multi-process encode pool for the duration of an indexing run if encode_workers > 1."""
+        if self.encode_workers <= 1:
+            yield None
+            return
+        pool = self.embedding_model.start_multi_process_pool(target_devices=["cpu"] * self.encode_workers)
+        try:
+            yield pool
+        finally:
+            self.embedding_model.stop_multi_process_pool(pool)
+
+    def create_embeddings(self, data, pool=None):
+        """
+        Encodes records in batches, optionally across the worker processes of an encode pool.
+
+        Args:
+            data: A list of record dictionaries as returned by chunk_data or question_data.
+            pool: An optional pool from encode_pool.
+
+        Returns:
+            A contiguous float32 NumPy array with one embedding row per record.
+        """
+        texts = [item["text"] for item in data]
+        if not texts:
+            dimension = self.embedding_model.get_sentence_embedding_dimension()
+            return np.empty((0, dimension), dtype=np.float32)
+
+        if pool is not None:
+            embeddings = self.embedding_model.encode_multi_process(texts, pool, batch_size=self.encode_batch_size)
+        else:
+            embeddings = self.embedding_model.encode(
+                texts, batch_size=self.encode_batch_size, convert_to_numpy=True
             )
-        return collection
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def encode_query(self, query):
+        """Encodes one user query, so a single embedding can serve both the FAQ match and the chunk search."""
+        return self.embedding_model.encode(query, convert_to_numpy=True)
+
+    def max_batch_size(self):
+        """Returns the largest number of records ChromaDB accepts in one add/upsert call."""
+        get_max_batch_size = getattr(self.chroma_client, "get_max_batch_size", None)
+        if get_max_batch_size is not None:
+            return get_max_batch_size()
+        return getattr(self.chroma_client, "max_batch_size", 5461)
+
+    def create_chroma_collection(self):
+        return self.chroma_client.create_collection(name=self.collection_name)
+
+    def get_or_create_questions_collection(self):
+        # Cosine space, so the nearest question is ranked the same way match_faq scores it,
+        # whether or not the embedding model returns unit-length vectors
+        return self.chroma_client.get_or_create_collection(
+            name=self.questions_collection_name, metadata={"hnsw:space": "cosine"}
+        )
+
+    def add_records(self, collection, records, embeddings):
+        """
+        Upserts a batch of records and their embeddings, split into calls ChromaDB accepts.
 
-    def query_chroma(self, query, n_results=2):
-        query_embedding = self.embedding_model.encode(query).tolist()
-        collection = self.chroma_client.get_collection(name=self.collection_name)
-        results = collection.query(
-            query_embeddings=[query_embedding],
+        Args:
+            collection: The ChromaDB collection to write to.
+            records: A list of record dictionaries.
+            embeddings: The matching NumPy array of embeddings.
+        """
+        step = self.max_batch_size()
+        for start in range(0, len(records), step):
+            batch = records[start:start + step]
+            collection.upsert(
+                embeddings=embeddings[start:start + step].tolist(),  # converted only at insertion time
+                documents=[item["document"] for item in batch],
+                metadatas=[item["metadata"] for item in batch],  # we add the metadatas
+                ids=[item["id"] for item in batch]
+            )
+
+    def get_collection_ids(self, collection):
+        """Returns the set of all record IDs stored in a collection, fetched page by page."""
+        ids = set()
+        step = self.max_batch_size()
+        offset = 0
+        while True:
+            page = collection.get(include=[], limit=step, offset=offset)["ids"]
+            ids.update(page)
+            if len(page) < step:
+                return ids
+            offset += step
+
+    def sync_collection(self, collection, records, pool=None):
+        """
+        Brings a collection in line with the data file: only records whose ID is not stored yet
+        are embedded and upserted, and records that disappeared from the export are deleted.
+
+        Args:
+            collection: The ChromaDB collection to update (may be empty).
+            records: An iterable of records from chunk_data or question_data.
+            pool: An optional pool from encode_pool.
+
+        Returns:
+            A tuple (added, removed) with the number of records written and deleted.
+        """
+        existing_ids = self.get_collection_ids(collection)
+        seen_ids = set()
+
+        def new_records():
+            for item in records:
+                if item["id"] in seen_ids:
+                    continue  # identical record repeated in the export
+                seen_ids.add(item["id"])
+                if item["id"] not in existing_ids:
+                    yield item
+
+        added = 0
+        for record_batch in batched(new_records(), self.ingest_batch_size):
+            embeddings = self.create_embeddings(record_batch, pool)
+            self.add_records(collection, record_batch, embeddings)
+            added += len(record_batch)
+
+        removed_ids = list(existing_ids - seen_ids)
+        step = self.max_batch_size()
+        for start in range(0, len(removed_ids), step):
+            collection.delete(ids=removed_ids[start:start + step])
+
+        print(f"{collection.name}: {added} records added, {len(removed_ids)} removed")
+        return added, len(removed_ids)
+
+    def sync_all(self, collection, questions_collection):
+        """Delta-updates both the answer chunk collection and the FAQ question collection."""
+        with self.encode_pool() as pool:
+            self.sync_collection(collection, self.chunk_data(self.load_data()), pool)
+            self.sync_collection(questions_collection, self.question_data(self.load_data()), pool)
+
+    def get_collection(self):
+        """Returns the cached collection handle, fetching it from ChromaDB the first time."""
+        if self._collection is None:
+            self._collection = self.chroma_client.get_collection(name=self.collection_name)
+        return self._collection
+
+    def get_questions_collection(self):
+        """Returns the cached handle of the FAQ question collection."""
+        if self._questions_collection is None:
+            self._questions_collection = self.chroma_client.get_collection(name=self.questions_collection_name)
+        return self._questions_collection
+
+    def match_faq(self, query_embedding):
+        """
+        Looks for a stored FAQ question that the query is a near-exact paraphrase of.
+
+        Args:
+            query_embedding: The query embedding from encode_query.
+
+        Returns:
+            A dictionary with the matched "question", its "answer" and the cosine "similarity",
+            or None if no question reaches faq_match_threshold.
+        """
+        normalized = query_embedding / max(np.linalg.norm(query_embedding), 1e-12)
+        results = self.get_questions_collection().query(
+            query_embeddings=[normalized.tolist()],
+            n_results=1,
+            include=['documents', 'metadatas', 'embeddings']
+        )
+        if not results["ids"][0]:
+            return None
+        stored = np.asarray(results["embeddings"][0][0], dtype=np.float32)
+        similarity = float(np.dot(normalized, stored) / max(np.linalg.norm(stored), 1e-12))
+        if similarity < self.faq_match_threshold:
+            return None
+        return {
+            "question": results["metadatas"][0][0]["source"],
+            "answer": results["documents"][0][0],
+            "similarity": similarity,
+        }
+
+    def query_chroma(self, query, n_results=2, query_embedding=None):
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        results = self.get_collection().query(
+            query_embeddings=[query_embedding.tolist()],
             n_results=n_results,
             include=['documents', 'metadatas']  # we include the metadatas and documents
         )
         return results
 
-    def process_data_and_create_collection(self):
+    def query_batch(self, queries, n_results=2):
+        """
+        Retrieves chunks for many queries with one batched encode and one ChromaDB query.
+
+        Args:
+            queries: A list of query strings.
+            n_results: The number of chunks to return per query.
+
+        Returns:
+            The ChromaDB query results, with one entry per query in "documents" and "metadatas".
+        """
+        queries = list(queries)
+        if not queries:
+            # ChromaDB rejects an empty list of query embeddings
+            return {"ids": [], "documents": [], "metadatas": []}
+        query_embeddings = self.embedding_model.encode(
+            queries, batch_size=self.encode_batch_size, convert_to_numpy=True
+        )
+        return self.get_collection().query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=n_results,
+            include=['documents', 'metadatas']
+        )
+
+    def compute_fingerprint(self):
+        """
+        Computes a fingerprint of everything the collection contents depend on.
+
+        Returns:
+            A dictionary with an "index_signature" of the embedding model name and chunking settings
+            (a change requires re-embedding everything) and a "data_hash" of the data file contents
+            (a change only requires a delta update).
+        """
+        signature = hashlib.sha256()
+        signature.update(self.embedding_model_name.encode("utf-8"))
+        signature.update(repr(self.chunk_separator).encode("utf-8"))
+        signature.update(str(INDEX_LAYOUT_VERSION).encode("utf-8"))
+
+        data_hash = hashlib.sha256()
+        with open(self.data_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):  # read in 1 MB blocks
+                data_hash.update(block)
+        return {"index_signature": signature.hexdigest(), "data_hash": data_hash.hexdigest()}
+
+    def get_or_create_collection(self):
+        """
+        Attaches to the existing collection if it was built from the same data, model and chunking
+        settings, applies a delta update if only the data changed, and rebuilds it otherwise.
+
+        Returns:
+            The ChromaDB collection, ready for querying.
+        """
+        fingerprint = self.compute_fingerprint()
+        try:
+            collection = self.chroma_client.get_collection(name=self.collection_name)
+        except Exception as e:
+            print(f"Collection does not exist: {e}. We need to create it")
+            return self.process_data_and_create_collection(fingerprint)
+
+        stored = collection.metadata or {}
+        if stored.get("index_signature") != fingerprint["index_signature"]:
+            print("Embedding model or chunking settings changed: rebuilding the collection")
+            self.delete_chroma_collection()
+            return self.process_data_and_create_collection(fingerprint)
+
+        questions_collection = self.get_or_create_questions_collection()
+        self._collection = collection
+        self._questions_collection = questions_collection
+        if stored.get("data_hash") == fingerprint["data_hash"]:
+            print("Collection is up to date: reusing it")
+            return collection
+
+        print("Data file changed: applying a delta update")
+        self.sync_all(collection, questions_collection)
+        collection.modify(metadata=fingerprint)
+        return collection
+
+    def process_data_and_create_collection(self, fingerprint=None):
+        """
+        Streams the data file through chunking, batched embedding and size-limited upserts, so
+        peak memory depends on ingest_batch_size rather than on the size of the export.
+
+        Returns:
+            The populated ChromaDB collection.
+        """
         if not os.path.exists(self.persist_directory):
             os.makedirs(self.persist_directory)
-        data = self.load_data()
-        chunked_data = self.chunk_data(data)
-        data_with_embeddings = self.create_embeddings(chunked_data)
+        if fingerprint is None:
+            fingerprint = self.compute_fingerprint()
         try:
-            collection = self.create_chroma_collection(data_with_embeddings)
+            collection = self.create_chroma_collection()
+            questions_collection = self.get_or_create_questions_collection()
+            self.sync_all(collection, questions_collection)
+            # The fingerprint is only recorded once every record is in, so an interrupted
+            # build is never mistaken for a complete one
+            collection.modify(metadata=fingerprint)
+            self._collection = collection
+            self._questions_collection = questions_collection
         except Exception as e:
             print(f"An error occurred while creating the collection: {e}")
             raise
         return collection
 
     def delete_chroma_collection(self):
-        try:
-            self.chroma_client.delete_collection(name=self.collection_name)
-            print(f"Successfully deleted collection: {self.collection_name}")
-        except Exception as e:
-            print(f"Error deleting collection {self.collection_name}: {e}")
+        self._collection = None
+        self._questions_collection = None
+        for name in [self.collection_name, self.questions_collection_name]:
+            try:
+                self.chroma_client.delete_collection(name=name)
+                print(f"Successfully deleted collection: {name}")
+            except Exception as e:
+                print(f"Error deleting collection {name}: {e}")
@@ -1,142 +1,431 @@
-import requests
-from bs4 import BeautifulSoup
-import re
+import argparse
+import asyncio
+import hashlib
+import json
 import os
-import time  # Added time in order to make some time between requests
+import random
+import re
+import time
+from urllib.parse import urljoin, urlparse
+
+import httpx
+from bs4 import BeautifulSoup
 
 print("Script has started!")
 
+FAQS_FILE = os.path.join("output", "faqs.jsonl")
+CRAWL_LOG_FILE = FAQS_FILE + ".part"
+HTTP_CACHE_FILE = os.path.join("output", "http_cache.json")
+DELTA_FILE = os.path.join("output", "faqs_delta.json")
+
+
+def write_json_atomic(data, path):
+    """Writes JSON to a temporary file and renames it into place, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
 
-def download_faqs(url):
+
+def read_jsonl(path):
+    """Yields the records of a JSONL file one at a time."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: allows `rate` requests per second on average, with bursts of up
+    to `capacity` requests.
     """
-    Downloads FAQs and answers from the Freshdesk support page.
 
-    Args:
-        url: The URL of the Freshdesk support homepage.
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_links(html, div_class):
+    """
+    Returns the href of the first link inside every <div class="div_class">.
+
+    Category links sit in "list-lead" divs on the home page and article links in
+    "ellipsis" divs on category pages.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
+    for div in soup.find_all('div', class_=div_class):
+        link = div.find('a')
+        if link and link.has_attr('href'):
+            links.append(link['href'])
+    return links
+
+
+def parse_article(html, url):
+    """
+    Extracts the question (title) and answer (content) from an article page.
 
     Returns:
-        A list of dictionaries, where each dictionary represents an FAQ
-        and contains the question and answer. Returns None if an error occurs.
+        A {"question": ..., "answer": ...} dictionary, or None if either part is missing.
     """
-    try:
-        print(f"Attempting to fetch the base URL: {url}")
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        print(f"Successfully fetched the base URL: {url}")
+    article_soup = BeautifulSoup(html, 'html.parser')
 
-        soup = BeautifulSoup(response.content, 'html.parser')
+    question_element = article_soup.find('h2', class_='heading')
+    if not question_element:
+        print(f"    Warning: Could not find question for {url}")
+        return None
+    question = question_element.get_text(strip=True)
 
-        # Find all category links
-        category_links = []
-        category_divs = soup.find_all('div', class_='list-lead')
-        print(f"Number of category divs found: {len(category_divs)}")  # added this print
-        for div in category_divs:
-            link = div.find('a')
-            if link and link.has_attr('href'):
-                category_links.append(link['href'])
-        print(f"Number of category links found: {len(category_links)}")  # added this print
+    answer_element = article_soup.find('article', class_='article-body')
+    if not answer_element:
+        print(f"    Warning: Could not find answer for {url}")
+        return None
+    answer = answer_element.get_text(strip=True)
 
-        all_faqs = []
+    # Clean up the answer text a bit (optional)
+    answer = re.sub(r'\s+', ' ', answer)  # remove extra whitspaces
+    answer = re.sub(r'<[^>]+>', '', answer)  # remove all the tags
+    return {"question": question, "answer": answer}
 
-        for category_link in category_links:
-            full_category_url = "https://fitnesspassport.freshdesk.com" + category_link
-            print(f"Processing category: {full_category_url}")
 
+class CrawlLog:
+    """
+    Append-only JSONL log of processed articles. Each line holds the article URL, whether it was
+    added, changed, unchanged or removed, and its extracted record (or null if it had no usable
+    FAQ). Removed entries also keep the previous record, so the delta can report it.
+
+    Lines are written and flushed as soon as an article is parsed, so nothing is held in memory
+    and an interrupted crawl resumes by skipping the URLs already in the log.
+    """
+
+    def __init__(self, path=CRAWL_LOG_FILE):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            valid_bytes = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn last line from a crash
+                    self.done.add(entry["url"])
+                    valid_bytes += len(line)
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+            print(f"Resuming crawl: {len(self.done)} articles already processed")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, url, faq, status, previous=None):
+        entry = {"url": url, "status": status, "faq": faq}
+        if previous is not None:
+            entry["previous"] = previous
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.done.add(url)
+
+    def entries(self):
+        self._file.flush()
+        return read_jsonl(self.path)
+
+    def finalize(self, output_path=FAQS_FILE):
+        """
+        Writes the FAQ records of a complete crawl to output_path as JSONL, fsyncs it and atomically
+        renames it into place, then removes the log.
+
+        Returns:
+            The number of FAQ records written.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        count = 0
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for entry in read_jsonl(self.path):
+                if entry["faq"]:
+                    out.write(json.dumps({"url": entry["url"], **entry["faq"]}, ensure_ascii=False) + "\n")
+                    count += 1
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, output_path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(output_path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)  # make the rename itself durable
+        finally:
+            os.close(dir_fd)
+        os.remove(self.path)
+        return count
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class HttpCache:
+    """
+    Per-URL validators from the previous crawl: ETag, Last-Modified, a hash of the body and the
+    record extracted from it, so unchanged articles are neither downloaded nor parsed again.
+    """
+
+    def __init__(self, path=HTTP_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def conditional_headers(self, url):
+        entry = self.entries.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url, response, body_hash, faq):
+        self.entries[url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": body_hash,
+            "faq": faq,
+        }
+
+    def save(self):
+        write_json_atomic(self.entries, self.path)
+
+
+class Crawler:
+    """
+    Async Freshdesk crawler with a shared connection pool, a per-host token-bucket rate limit
+    and a bound on the number of requests in flight.
+    """
+
+    def __init__(self, rate=2.0, burst=2, concurrency=4, timeout=30.0, max_retries=3, crawl_log=None,
+                 http_cache=None, save_every=20):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.crawl_log = crawl_log or CrawlLog()
+        self.http_cache = http_cache or HttpCache()
+        self.save_every = save_every
+        self.complete = True  # set to False if any page failed, so removals aren't inferred
+        self._unsaved = 0
+        self._buckets = {}
+        self._semaphore = None
+        self._client = None
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    async def fetch(self, url, headers=None):
+        """
+        Fetches a page, retrying connection errors and 429/5xx responses with jittered backoff.
+        A 304 Not Modified response to a conditional request is returned as is.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(url).acquire()
             try:
-                category_response = requests.get(full_category_url)
-                category_response.raise_for_status()
-                category_soup = BeautifulSoup(category_response.content, 'html.parser')
-                print(f"Successfully fetched category: {full_category_url}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error fetching category {full_category_url}: {e}")
-                continue  # Skip to the next category on error
-
-            # Find all article links within the category
-            article_links = []
-            article_divs = category_soup.find_all('div', class_='ellipsis') # Corrected line. We find all the div with ellipsis
-            print(f"  Number of article divs found: {len(article_divs)}")  # added this print
-
-            for div in article_divs: # We loop in the divs
-                link = div.find('a') # We get the link from the div
-                if link and link.has_attr('href'):
-                    article_links.append(link['href'])
-            print(f"  Number of article links found: {len(article_links)}")  # added this print
-
-            for article_link in article_links:
-                full_article_url = "https://fitnesspassport.freshdesk.com" + article_link
-                print(f"  Processing article: {full_article_url}")
-                try:
-                    article_response = requests.get(full_article_url)
-                    article_response.raise_for_status()
-                    article_soup = BeautifulSoup(article_response.content, 'html.parser')
-                    print(f"  Successfully fetched article: {full_article_url}")
-                    time.sleep(1)  # Wait 1 second after each request (added for respect)
-                except requests.exceptions.RequestException as e:
-                    print(f"  Error fetching article {full_article_url}: {e}")
-                    continue  # Skip to the next article on error
-
-                # Extract question (title)
-                try:
-                    question_element = article_soup.find('h2', class_='heading')  # Changed this line
-                    if question_element:
-                        question = question_element.get_text(strip=True)
-                    else:
-                        print(f"    Warning: Could not find question for {full_article_url}")
-                        continue
-                except Exception as e:
-                    print(
-                        f"    Warning: Error while getting the question for {full_article_url}, error: {e}")
-                    continue
+                async with self._semaphore:
+                    response = await self._client.get(url, headers=headers)
+                if response.status_code == 304:
+                    return response
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, 2 ** attempt))
 
-                # Extract Answer (content)
+    def save(self):
+        self.http_cache.save()
+        self._unsaved = 0
+
+    async def process_article(self, article_url):
+        print(f"  Processing article: {article_url}")
+        cached = self.http_cache.entries.get(article_url)
+        try:
+            article_response = await self.fetch(article_url, self.http_cache.conditional_headers(article_url))
+        except httpx.HTTPError as e:
+            print(f"  Error fetching article {article_url}: {e}")
+            self.complete = False
+            return  # not logged, so it is retried on the next run
+
+        previous = cached.get("faq") if cached else None
+        if article_response.status_code == 304 and cached:
+            print(f"  Not modified: {article_url}")
+            faq, status = previous, "unchanged"
+        else:
+            body_hash = hashlib.sha256(article_response.content).hexdigest()
+            if cached and cached.get("sha256") == body_hash:
+                print(f"  Unchanged content: {article_url}")
+                faq, status = previous, "unchanged"
+            else:
                 try:
-                    answer_element = article_soup.find('article', class_='article-body')  # changed this line
-                    if answer_element:
-                        answer = answer_element.get_text(strip=True)
-
-                        # Clean up the answer text a bit (optional)
-                        answer = re.sub(r'\s+', ' ', answer)  # remove extra whitspaces
-                        answer = re.sub(r'<[^>]+>', '', answer)  # remove all the tags
-                    else:
-                        print(f"    Warning: Could not find answer for {full_article_url}")
-                        continue
+                    faq = parse_article(article_response.text, article_url)
                 except Exception as e:
-                    print(
-                        f"    Warning: Error while getting the answer for {full_article_url}, error: {e}")
-                    continue
+                    print(f"    Warning: Error while parsing {article_url}, error: {e}")
+                    faq = None
+                if faq:
+                    print(f"Successfully extracted Question and Answer from: {article_url}")
+                # Freshdesk pages carry per-request tokens, so a new body hash alone doesn't mean the
+                # FAQ changed; only the extracted record decides
+                if faq == previous:
+                    status = "unchanged"
+                elif not faq:
+                    status = "removed"  # previously had a record, no longer parses to one
+                elif previous:
+                    status = "changed"
+                else:
+                    status = "added"
+            # Refresh the validators either way, so the next crawl can send them
+            self.http_cache.update(article_url, article_response, body_hash, faq)
 
-                all_faqs.append({"question": question, "answer": answer})
-                print(f"Successfully extracted Question and Answer from: {full_article_url}")
+        self.crawl_log.record(article_url, faq, status, previous if status == "removed" else None)
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
 
-        print(f"Total FAQs extracted: {len(all_faqs)}")  # Added this print
-        if len(all_faqs) == 0:
-            return None
-        else:
-            return all_faqs
+    async def process_category(self, category_url):
+        print(f"Processing category: {category_url}")
+        try:
+            category_response = await self.fetch(category_url)
+            print(f"Successfully fetched category: {category_url}")
+        except httpx.HTTPError as e:
+            print(f"Error fetching category {category_url}: {e}")
+            self.complete = False
+            return  # Skip to the next category on error
 
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection error occurred: {e}")
-        return None
-    except requests.exceptions.Timeout as e:
-        print(f"Timeout error occurred: {e}")
-        return None
-    except requests.exceptions.TooManyRedirects as e:
-        print(f"Too many redirects occurred: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"A requests error occurred: {e}")
+        article_links = parse_links(category_response.text, 'ellipsis')
+        print(f"  Number of article links found: {len(article_links)}")
+        article_urls = [urljoin(category_url, link) for link in article_links]
+        pending = [url for url in article_urls if url not in self.crawl_log.done]
+        await asyncio.gather(*(self.process_article(url) for url in pending))
+
+    async def crawl(self, url):
+        """
+        Crawls every category and article reachable from the support home page, appending each
+        article to the crawl log as soon as it is parsed.
+        """
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=True) as client:
+            self._client = client
+            print(f"Attempting to fetch the base URL: {url}")
+            response = await self.fetch(url)
+            print(f"Successfully fetched the base URL: {url}")
+
+            category_links = parse_links(response.text, 'list-lead')
+            print(f"Number of category links found: {len(category_links)}")
+            try:
+                await asyncio.gather(
+                    *(self.process_category(urljoin(url, link)) for link in category_links)
+                )
+            finally:
+                self.save()
+
+    def delta(self):
+        """
+        Returns the records that changed since the previous crawl, for downstream re-indexing.
+
+        Articles that were fetched but no longer parse to a record are always reported as removed.
+        Articles that are cached but were not seen in this crawl are only reported, and dropped
+        from the cache, when every page of the crawl was fetched successfully.
+        """
+        delta = {"added": [], "changed": [], "removed": []}
+        for entry in self.crawl_log.entries():
+            if entry["status"] in ("added", "changed") and entry["faq"]:
+                delta[entry["status"]].append({"url": entry["url"], **entry["faq"]})
+            elif entry["status"] == "removed" and entry.get("previous"):
+                delta["removed"].append({"url": entry["url"], **entry["previous"]})
+        if self.complete:
+            for url in set(self.http_cache.entries) - self.crawl_log.done:
+                removed = self.http_cache.entries.pop(url)
+                if removed.get("faq"):
+                    delta["removed"].append({"url": url, **removed["faq"]})
+            self.http_cache.save()
+        return delta
+
+
+def download_faqs(url, rate=2.0, burst=2, concurrency=4, output_path=FAQS_FILE, delta_path=DELTA_FILE):
+    """
+    Downloads FAQs and answers from the Freshdesk support page.
+
+    Records are appended to output_path + ".part" as each article is parsed. Once the crawl is
+    complete they are written to output_path (one JSON record per line) and the delta is saved.
+
+    Args:
+        url: The URL of the Freshdesk support homepage.
+        rate: Average requests per second allowed per host.
+        burst: Requests allowed in a burst per host.
+        concurrency: Maximum number of requests in flight.
+        output_path: Where the FAQs are written as JSONL.
+        delta_path: Where the added, changed and removed records of this crawl are written.
+
+    Returns:
+        The path of the JSONL file, where each line is an FAQ with its url, question and
+        answer. Returns None if an error occurs or no FAQs were found.
+    """
+    crawl_log = CrawlLog(output_path + ".part")
+    crawler = Crawler(rate=rate, burst=burst, concurrency=concurrency, crawl_log=crawl_log)
+    try:
+        asyncio.run(crawler.crawl(url))
+    except httpx.HTTPError as e:
+        crawl_log.close()
+        print(f"A requests error occurred: {e}. Progress is saved in {crawl_log.path}")
         return None
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        crawl_log.close()
+        print(f"An unexpected error occurred: {e}. Progress is saved in {crawl_log.path}")
         return None
 
+    delta = crawler.delta()
+    total = crawl_log.finalize(output_path)
+    write_json_atomic(delta, delta_path)
+    print(
+        f"Delta saved to {delta_path}: {len(delta['added'])} added, "
+        f"{len(delta['changed'])} changed, {len(delta['removed'])} removed"
+    )
+
+    print(f"Total FAQs extracted: {total}")  # Added this print
+    if total == 0:
+        return None
+    else:
+        return output_path
+
 
 def save_faqs_to_file(faqs, filename="faqs.txt"):
     """
     Saves the extracted FAQs to a text file.
 
     Args:
-        faqs: A list of dictionaries, where each dictionary contains a question and answer.
+        faqs: An iterable of dictionaries, where each dictionary contains a question and answer.
         filename: The name of the file to save the data to.
     """
     if faqs:
@@ -155,41 +444,20 @@ def save_faqs_to_file(faqs, filename="faqs.txt"):
         print("No FAQs to save.")
 
 
-def save_faqs_to_json(faqs, filename="faqs.json"):
-    """
-    Saves the extracted FAQs to a JSON file.
-
-    Args:
-        faqs: A list of dictionaries, where each dictionary contains a question and answer.
-        filename: The name of the file to save the data to.
-    """
-    import json
-
-    if faqs:
-        try:
-            if not os.path.exists("output"):
-                os.makedirs("output")
-
-            with open(os.path.join("output", filename), 'w', encoding='utf-8') as f:
-                json.dump(faqs, f, indent=4, ensure_ascii=False)
-            print(f"Successfully saved FAQs to {filename}")
-        except Exception as e:
-            print(f"Error saving to JSON file: {e}")
-    else:
-        print("No FAQs to save.")
-
-
 if __name__ == "__main__":
-    base_url = "https://fitnesspassport.freshdesk.com/support/home"
-    extracted_faqs = download_faqs(base_url)
-    if extracted_faqs:
+    parser = argparse.ArgumentParser(description="Scrape the Fitness Passport Freshdesk FAQs")
+    parser.add_argument("--url", default="https://fitnesspassport.freshdesk.com/support/home",
+                        help="Support home page (point it at a local fixture server for testing)")
+    parser.add_argument("--rate", type=float, default=2.0, help="Average requests per second per host")
+    parser.add_argument("--burst", type=int, default=2, help="Requests allowed in a burst per host")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum requests in flight")
+    args = parser.parse_args()
+
+    faqs_path = download_faqs(args.url, rate=args.rate, burst=args.burst, concurrency=args.concurrency)
+    if faqs_path:
+        print(f"FAQs saved to {faqs_path}")
         print("Saving  to file ....")
-        save_faqs_to_file(extracted_faqs)
+        save_faqs_to_file(read_jsonl(faqs_path))  # streamed, one record at a time
         print("Saving  to file .... done!")
-        print("-----------------------------")
-        print("Saving  to JSON ..........")
-        save_faqs_to_json(extracted_faqs)
-        print("Saving  to JSON .... done!")
     else:
         print("Nothing to save")
-
@@ -0,0 +1,241 @@
+"""
+Tests for scraper.py against saved Freshdesk pages served from a local HTTP server.
+
+Run from RAG_Fitness_First with: python -m unittest discover tests
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# URL path -> saved page, laid out like the real help center
+ROUTES = {
+    "/support/home": "home.html",
+    "/support/solutions/folders/1": "folder_1.html",
+    "/support/solutions/folders/2": "folder_2.html",
+    "/support/solutions/articles/101": "article_101.html",
+    "/support/solutions/articles/102": "article_102.html",
+    "/support/solutions/articles/103": "article_103.html",
+    "/support/solutions/articles/201": "article_201.html",
+    "/support/solutions/articles/202": "article_202.html",
+    "/support/solutions/articles/203": "article_203.html",
+}
+ARTICLES_WITH_FAQS = 5
+
+
+class FixtureServer:
+    """
+    Serves ROUTES on an ephemeral port and records every requested path. Pages get an ETag from
+    their content and answer a matching If-None-Match with 304. With `csrf_tokens` set, every
+    response carries a fresh token and no ETag, like Freshdesk pages rendered per request.
+    """
+
+    def __init__(self, csrf_tokens=False):
+        self.csrf_tokens = csrf_tokens
+        self.requests = []
+        self.overrides = {}  # URL path -> replacement page body
+        fixture_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fixture_server.requests.append(self.path)
+                if self.path in fixture_server.overrides:
+                    body = fixture_server.overrides[self.path]
+                elif self.path in ROUTES:
+                    with open(os.path.join(FIXTURES, ROUTES[self.path]), "rb") as f:
+                        body = f.read()
+                else:
+                    self.send_error(404)
+                    return
+
+                headers = {"Content-Type": "text/html; charset=utf-8"}
+                if fixture_server.csrf_tokens:
+                    token = os.urandom(8).hex().encode("ascii")
+                    body = body.replace(b"</head>", b'<meta name="csrf-token" content="' + token + b'"></head>')
+                else:
+                    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    headers["ETag"] = etag
+
+                self.send_response(200)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def article_requests(self):
+        return [path for path in self.requests if "/articles/" in path]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ScraperTestCase(unittest.TestCase):
+    """Runs each test in a temporary working directory, since the HTTP cache lives under output/."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+        self.output_path = os.path.join("output", "faqs.jsonl")
+        self.delta_path = os.path.join("output", "faqs_delta.json")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def start_server(self, **kwargs):
+        server = FixtureServer(**kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def crawl(self, server):
+        return scraper.download_faqs(
+            server.base_url + "/support/home", rate=200, burst=20, concurrency=4,
+            output_path=self.output_path, delta_path=self.delta_path,
+        )
+
+    def read_delta(self):
+        with open(self.delta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+class CrawlTest(ScraperTestCase):
+
+    def test_crawl_writes_every_record(self):
+        server = self.start_server()
+        self.assertEqual(self.crawl(server), self.output_path)
+
+        records = list(scraper.read_jsonl(self.output_path))
+        self.assertEqual(len(records), ARTICLES_WITH_FAQS)
+        by_url = {record["url"]: record for record in records}
+        self.assertEqual(
+            by_url[server.base_url + "/support/solutions/articles/102"]["answer"],
+            "Yes. Partners and children can be added to your membership for an additional fee.",
+        )
+        self.assertEqual(len(self.read_delta()["added"]), ARTICLES_WITH_FAQS)
+        self.assertFalse(os.path.exists(self.output_path + ".part"))
+
+    def test_resume_skips_articles_in_the_crawl_log(self):
+        server = self.start_server()
+        done_url = server.base_url + "/support/solutions/articles/101"
+        os.makedirs("output")
+        with open(self.output_path + ".part", "w", encoding="utf-8") as f:
+            faq = {"question": "How do I join?", "answer": "From the log"}
+            f.write(json.dumps({"url": done_url, "status": "added", "faq": faq}) + "\n")
+            f.write('{"url": "torn')  # last line cut off by a crash
+
+        self.assertEqual(self.crawl(server), self.output_path)
+
+        self.assertNotIn("/support/solutions/articles/101", server.article_requests())
+        self.assertEqual(len(server.article_requests()), len(ROUTES) - 4)
+        records = {record["url"]: record for record in scraper.read_jsonl(self.output_path)}
+        self.assertEqual(len(records), ARTICLES_WITH_FAQS)
+        self.assertEqual(records[done_url]["answer"], "From the log")
+
+
+class RecrawlTest(ScraperTestCase):
+
+    def test_unchanged_pages_are_served_from_the_cache(self):
+        server = self.start_server()
+        self.crawl(server)
+        self.crawl(server)
+
+        self.assertEqual(self.read_delta(), {"added": [], "changed": [], "removed": []})
+        self.assertEqual(len(list(scraper.read_jsonl(self.output_path))), ARTICLES_WITH_FAQS)
+
+    def test_per_request_tokens_do_not_count_as_changes(self):
+        server = self.start_server(csrf_tokens=True)
+        self.crawl(server)
+        self.crawl(server)
+
+        self.assertEqual(self.read_delta(), {"added": [], "changed": [], "removed": []})
+
+    def test_changed_and_removed_records(self):
+        server = self.start_server(csrf_tokens=True)
+        self.crawl(server)
+
+        with open(os.path.join(FIXTURES, "article_102.html"), "rb") as f:
+            server.overrides["/support/solutions/articles/102"] = f.read().replace(b"additional fee", b"small fee")
+        with open(os.path.join(FIXTURES, "article_203.html"), "rb") as f:
+            server.overrides["/support/solutions/articles/103"] = f.read()  # answer body gone
+        self.crawl(server)
+
+        delta = self.read_delta()
+        self.assertEqual(delta["added"], [])
+        self.assertEqual([record["url"] for record in delta["changed"]],
+                         [server.base_url + "/support/solutions/articles/102"])
+        self.assertIn("small fee", delta["changed"][0]["answer"])
+        self.assertEqual(delta["removed"], [{
+            "url": server.base_url + "/support/solutions/articles/103",
+            "question": "How do I cancel?",
+            "answer": "Contact your employer's program coordinator to cancel. "
+                      "Cancellations apply from the next pay cycle.",
+        }])
+        self.assertEqual(len(list(scraper.read_jsonl(self.output_path))), ARTICLES_WITH_FAQS - 1)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_limits_requests_to_the_rate_after_the_burst(self):
+        async def acquire_all():
+            bucket = scraper.TokenBucket(rate=20, capacity=2)
+            start_time = time.monotonic()
+            for _ in range(6):
+                await bucket.acquire()
+            return time.monotonic() - start_time
+
+        # Two requests go out as a burst, the other four wait 1/20 s each
+        elapsed = asyncio.run(acquire_all())
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertLess(elapsed, 1.0)
+
+
+class ParseTest(unittest.TestCase):
+
+    def read_fixture(self, name):
+        with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def test_parse_links(self):
+        self.assertEqual(
+            scraper.parse_links(self.read_fixture("home.html"), "list-lead"),
+            ["/support/solutions/folders/1", "/support/solutions/folders/2"],
+        )
+
+    def test_parse_article(self):
+        self.assertEqual(
+            scraper.parse_article(self.read_fixture("article_201.html"), "article_201"),
+            {"question": "Which gyms are included?",
+             "answer": "Use the facility search on our website to see every participating gym and pool."},
+        )
+        self.assertIsNone(scraper.parse_article(self.read_fixture("article_203.html"), "article_203"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,24 @@
 
 import openai
 import os
+import hashlib
+import random
+import threading
+import time
 from openai import OpenAI  # Import the OpenAI class
 
+# One client per API key, reused across messages so HTTP connections stay alive
+_client_lock = threading.Lock()
+_clients = {}
+
+# Errors worth retrying: the request never produced a response or the server asked us to back off
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
 def build_prompt(user_question, retrieved_chunks):
     prompt = "You are a helpful chatbot designed to answer questions about Fitness Passport.\n\n"
     prompt += "Here is some information from our FAQs that might be relevant to the user's question:\n---\n"
@@ -14,6 +30,22 @@ def build_prompt(user_question, retrieved_chunks):
     prompt += "Based on the information provided above, answer the user's question to the best of your ability. If the context does not answer the question, you can tell the user that you don't have the answer."
     return prompt
 
+def format_references(retrieved_metadatas):
+    """
+    Formats clickable references to the source documents.
+
+    Args:
+        retrieved_metadatas: A list of metadata dictionaries returned from ChromaDB.
+
+    Returns:
+        The references block as markdown.
+    """
+    references = "References:\n"
+    for metadata in retrieved_metadatas: # we loop in the metadatas
+        source = metadata["source"]
+        references += f"- [{source}]({source})\n" # we create the links using the source text
+    return references
+
 def format_response_with_references(response_text, retrieved_metadatas): # we create a function for the references
     """
     Formats the response text with clickable references to the source documents.
@@ -25,17 +57,69 @@ def format_response_with_references(response_text, retrieved_metadatas): # we cr
     Returns:
         The formatted response text with clickable references.
     """
-    formatted_response = response_text + "\n\n" # we add the original response
-    formatted_response += "References:\n"
-    for metadata in retrieved_metadatas: # we loop in the metadatas
-        source = metadata["source"]
-        formatted_response += f"- [{source}]({source})\n" # we create the links using the source text
-    return formatted_response
+    return response_text + "\n\n" + format_references(retrieved_metadatas)
+
+def get_openai_client(api_key):
+    """
+    Returns the pooled OpenAI client for an API key, creating it on first use.
+
+    The client keeps its HTTP connections alive between messages. Its built-in retries are
+    disabled because create_with_retries handles them with jittered backoff.
+    """
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()  # don't keep raw keys as dict keys
+    with _client_lock:
+        if key not in _clients:
+            _clients[key] = OpenAI(api_key=api_key, max_retries=0)
+        return _clients[key]
+
+def create_with_retries(client, max_retries=3, base_delay=0.5, **kwargs):
+    """
+    Calls chat.completions.create, retrying transient errors with full-jitter exponential backoff.
+
+    Args:
+        client: An OpenAI client from get_openai_client.
+        max_retries: How many times to retry after the first attempt.
+        base_delay: The backoff ceiling in seconds for the first retry; it doubles on each retry.
+        **kwargs: Passed through to chat.completions.create.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return client.chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            print(f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+def stream_openai_response(prompt, api_key):
+    """
+    Streams the chatbot's answer as it is generated.
+
+    Retries only cover opening the stream; once tokens have been shown they are not re-requested.
+
+    Args:
+        prompt: The full prompt from build_prompt.
+        api_key: The user's OpenAI API key.
+
+    Yields:
+        Pieces of the response text.
+    """
+    client = get_openai_client(api_key)
+    stream = create_with_retries(
+        client,
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
-def get_openai_response(prompt, retrieved_metadatas): # we now pass the retrieved_metadatas
-    openai.api_key = os.environ.get("OPENAI_API_KEY")
-    client = OpenAI()  # Create an instance of the OpenAI client
-    response = client.chat.completions.create(  # Use the new API interface
+def get_openai_response(prompt, retrieved_metadatas, api_key=None): # we now pass the retrieved_metadatas
+    client = get_openai_client(api_key or os.environ.get("OPENAI_API_KEY"))
+    response = create_with_retries(  # Use the new API interface
+        client,
         model="gpt-3.5-turbo",
         messages=[{"role": "user", "content": prompt}],
     )
@@ -0,0 +1,140 @@
+"""
+Hot answer cache and query log for the Safaricom Smart Assistant.
+
+Most traffic is a handful of questions (MPESA registration, Fuliza, balance checks), so answers
+are cached by normalized query text. Entries expire after a TTL, the least recently used entry
+is evicted when the cache is full, and an entry only counts for the index snapshot (data hash)
+it was generated from. The query log records every incoming question in one JSONL file per day,
+so the next start can warm the cache with the previous day's most frequent questions.
+"""
+import os
+import json
+import time
+import queue
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from index_store import normalize_text
+
+class AnswerCache:
+    """Thread-safe LRU of normalized query -> answer with a TTL, plus hit-rate statistics"""
+
+    def __init__(self, max_entries=256, ttl_seconds=6 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # normalized query -> (answer, version, generation seconds, expires at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def _live_entry(self, key, version):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is not None and (entry[1] != version or entry[3] < time.monotonic()):
+            del self._entries[key]  # expired, or generated from older FAQ data
+            entry = None
+        return entry
+
+    def get(self, query_text, version):
+        """Cached answer for a query under the given index version, or None"""
+        key = normalize_text(query_text)
+        with self._lock:
+            entry = self._live_entry(key, version)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return entry[0]
+
+    def put(self, query_text, version, answer, generation_seconds):
+        key = normalize_text(query_text)
+        with self._lock:
+            self._entries[key] = (answer, version, generation_seconds, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def has(self, query_text, version):
+        """Whether get would return an answer, without counting a hit or miss or refreshing recency"""
+        with self._lock:
+            return self._live_entry(normalize_text(query_text), version) is not None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"answer cache: {self.hits}/{lookups} hits ({hit_rate:.0%}), "
+            f"{self.saved_seconds:.1f}s of generation saved, {len(self._entries)} entries"
+        )
+
+class QueryLog:
+    """
+    Appends incoming questions to a JSONL file per day and ranks a day's most frequent ones.
+
+    log() only queues the line; a writer thread appends it, so the async request handlers never
+    wait on disk. Lines still queued when the process exits are lost.
+    """
+
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def path_for(self, day):
+        return os.path.join(self.log_dir, f"queries-{day.isoformat()}.jsonl")
+
+    def log(self, query_text):
+        now = datetime.now()
+        line = json.dumps({"time": now.isoformat(timespec="seconds"), "query": query_text}, ensure_ascii=False)
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_lines, name="query-log-writer", daemon=True)
+                self._writer.start()
+        self._queue.put((now.date(), line))
+
+    def flush(self):
+        """Blocks until every queued line has been written"""
+        self._queue.join()
+
+    def _write_lines(self):
+        while True:
+            batch = [self._queue.get()]
+            while not self._queue.empty():  # one open per day file for everything queued meanwhile
+                batch.append(self._queue.get())
+            try:
+                lines_by_day = {}
+                for day, line in batch:
+                    lines_by_day.setdefault(day, []).append(line + "\n")
+                os.makedirs(self.log_dir, exist_ok=True)
+                for day, lines in lines_by_day.items():
+                    with open(self.path_for(day), "a", encoding="utf-8") as f:
+                        f.writelines(lines)
+            except OSError as e:
+                print(f"Could not write the query log: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def top_queries(self, day, n):
+        """The n most frequent questions of a day (by normalized text), in their first-seen wording"""
+        path = self.path_for(day)
+        if not os.path.exists(path):
+            return []
+        counts = Counter()
+        wording = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    query_text = json.loads(line)["query"]
+                except (ValueError, KeyError):
+                    continue  # torn last line of a crashed process
+                key = normalize_text(query_text)
+                if key:
+                    counts[key] += 1
+                    wording.setdefault(key, query_text)
+        return [wording[key] for key, _ in counts.most_common(n)]
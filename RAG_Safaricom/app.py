@@ -1,10 +1,19 @@
 import os
-import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from dataclasses import dataclass, field
+from functools import lru_cache
 import numpy as np
 import faiss
 import gradio as gr
 from sentence_transformers import SentenceTransformer
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from index_store import IndexStore, IndexState, normalize_text
+from answer_cache import AnswerCache, QueryLog
 
 # ------------------------------
 # Configuration Parameters
@@ -13,115 +22,167 @@ CONFIDENCE_THRESHOLD = 0.6    # Reduced for MMR diversity
 MMR_LAMBDA = 0.7              # Balance relevance/diversity
 INITIAL_CANDIDATES = 20       # Candidates for MMR reranking
 FINAL_RESULTS = 5             # Final results after reranking
+DATA_FILE = "faq_data.json"
+MODEL_NAME = "all-mpnet-base-v2"
+DELTA_FILE = "faq_delta.json"  # Written by scraper.py next to DATA_FILE
+INDEX_CACHE_DIR = "index_cache"   # Persisted embeddings and FAISS index, keyed by data + model hash
+INDEX_FORMAT_VERSION = 3      # Bump when the loader changes what gets embedded or how it is stored
+DELTA_POLL_SECONDS = 30       # How often the running app checks for a new scraper delta
+INDEX_TYPE = "flat"           # "flat" (exact float32), "int8" or "binary" (quantized, rescored in float)
+RESCORE_FACTOR = 4            # Quantized candidates per INITIAL_CANDIDATES slot sent to float rescoring
+QUERY_CACHE_SIZE = 1024       # Query embeddings kept in the process-wide LRU
+CLIENT_POOL_SIZE = 32         # OpenAI clients kept alive, one per API key
+GRADIO_CONCURRENCY = 8        # Requests Gradio processes in parallel
+ANSWER_CACHE_SIZE = 256       # Generated answers kept for repeated questions
+ANSWER_CACHE_TTL = 6 * 3600   # Seconds before a cached answer is regenerated
+QUERY_LOG_DIR = "query_logs"  # One JSONL file of incoming questions per day
+WARM_TOP_N = 20               # Most frequent questions of the previous day answered at startup
+WARM_INTERVAL = 3600          # Seconds between warming passes, which regenerate expired or stale answers
+EXAMPLES = [
+    "How do I register for MPESA and check my balance?",
+    "What's the difference between Lipa Na MPESA and Fuliza?"
+]
+HOT_QUERIES = [               # Known high-traffic questions, warmed along with the examples
+    "How do I register for MPESA?",
+    "How do I check my MPESA balance?",
+    "What is Fuliza?"
+]
 
 # ------------------------------
-# Step 1: Load and Preprocess Data
+# Step 1: Load the Embedding Model and FAQ Index
 # ------------------------------
-with open("faq_data.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
+def format_sources(faq):
+    return ", ".join(faq["sources"])
 
-faq_list = []
-for url, faq_pairs in data.items():
-    for faq in faq_pairs:
-        faq_list.append({
-            "source": url,
-            "question": faq["question"],
-            "answer": faq["answer"]
-        })
+embedder = SentenceTransformer(MODEL_NAME)
 
-faq_texts = [f"Q: {faq['question']}\nA: {faq['answer']}" for faq in faq_list]
+# Deduplicated FAQs, persisted embeddings and the ID-mapped FAISS index, cached by data + model
+# hash. Scraper deltas (DELTA_FILE) are applied to it while the app is running.
+store = IndexStore(embedder, DATA_FILE, MODEL_NAME, INDEX_CACHE_DIR, INDEX_FORMAT_VERSION, INDEX_TYPE)
+store.load()
 
 # ------------------------------
-# Step 2: Build the Embedding Model and FAISS Index
+# Step 2: Core RAG Functions with MMR
 # ------------------------------
-embedder = SentenceTransformer("all-mpnet-base-v2")
-embeddings = embedder.encode(faq_texts, show_progress_bar=True)
+def mmr_rerank_batch(query_embs, candidate_embs, lambda_param=MMR_LAMBDA, final_k=FINAL_RESULTS):
+    """
+    Vectorized MMR reranking for a batch of queries.
 
-# Normalize embeddings for cosine similarity
-faiss.normalize_L2(embeddings)
-index = faiss.IndexFlatIP(embeddings.shape[1])
-index.add(embeddings.astype(np.float32))
+    query_embs has shape (queries, dim) and candidate_embs (queries, candidates, dim). Instead of
+    comparing every candidate with every selected document, a running max-similarity vector is
+    updated with one NumPy operation per selection step. Returns an int array of shape
+    (queries, final_k) with positions into each query's candidates, in selection order.
+    """
+    query_embs = np.asarray(query_embs, dtype=np.float32)
+    candidate_embs = np.asarray(candidate_embs, dtype=np.float32)
+    n_queries, n_candidates, _ = candidate_embs.shape
+    k = min(final_k, n_candidates)
+    rows = np.arange(n_queries)
+
+    query_sims = np.einsum("qcd,qd->qc", candidate_embs, query_embs)
+    max_sims = np.full((n_queries, n_candidates), -np.inf, dtype=np.float32)
+    available = np.ones((n_queries, n_candidates), dtype=bool)
+    selected = np.empty((n_queries, k), dtype=np.int64)
+
+    for step in range(k):
+        if step == 0:
+            scores = query_sims.copy()  # nothing selected yet: pure relevance
+        else:
+            scores = lambda_param * query_sims - (1 - lambda_param) * max_sims
+        scores[~available] = -np.inf
+        best = np.argmax(scores, axis=1)
+        selected[:, step] = best
+        available[rows, best] = False
+        # Fold the similarity to the newly selected document into the running max
+        np.maximum(max_sims, np.einsum("qcd,qd->qc", candidate_embs, candidate_embs[rows, best]), out=max_sims)
 
-# ------------------------------
-# Step 3: Core RAG Functions with MMR
-# ------------------------------
-def mmr_rerank(query_emb, candidate_embs, lambda_param=MMR_LAMBDA, final_k=FINAL_RESULTS):
-    """MMR reranking implementation"""
-    query_sims = np.dot(candidate_embs, query_emb.T).flatten()
-    doc_sims = np.dot(candidate_embs, candidate_embs.T)
-    
-    selected = []
-    remaining = list(range(len(candidate_embs)))
-    
-    while len(selected) < final_k and remaining:
-        scores = []
-        for i in remaining:
-            if not selected:
-                score = query_sims[i]
-            else:
-                max_sim = np.max(doc_sims[i, selected])
-                score = lambda_param * query_sims[i] - (1 - lambda_param) * max_sim
-            scores.append(score)
-        
-        best_idx = np.argmax(scores)
-        selected.append(remaining.pop(best_idx))
-    
     return selected
 
-def find_related_terms(query_text):
-    """Find related questions for fallback"""
-    query_embedding = embedder.encode([query_text])
+def mmr_rerank(query_emb, candidate_embs, lambda_param=MMR_LAMBDA, final_k=FINAL_RESULTS):
+    """MMR reranking implementation for a single query"""
+    return mmr_rerank_batch(
+        np.asarray(query_emb)[None], np.asarray(candidate_embs)[None], lambda_param, final_k
+    )[0].tolist()
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def encode_query(query_text):
+    """Normalized query embedding of shape (1, dim), cached process-wide so no text is encoded twice"""
+    query_embedding = np.ascontiguousarray(embedder.encode([query_text]), dtype=np.float32)
     faiss.normalize_L2(query_embedding)
-    _, indices = index.search(query_embedding.astype(np.float32), k=3)
-    
+    query_embedding.setflags(write=False)  # shared between requests through the cache
+    return query_embedding
+
+@dataclass
+class QueryContext:
+    """Per-request state: the query embedding, FAISS candidates and MMR selection, computed once"""
+    query_text: str
+    state: IndexState                 # index snapshot the request searched; later deltas don't affect it
+    query_embedding: np.ndarray       # (1, dim), normalized
+    scores: np.ndarray                # (INITIAL_CANDIDATES,) inner-product scores, best first
+    indices: np.ndarray               # (INITIAL_CANDIDATES,) rows in state.faq_list
+    final_indices: list = field(default_factory=list)
+    final_scores: np.ndarray = None
+    timings: dict = field(default_factory=dict)  # seconds spent in encode, search and mmr
+
+def retrieve(query_text):
+    """Encode the query, search FAISS and rerank the candidates with MMR"""
+    state = store.state  # one snapshot for the whole request, even if a delta is swapped in meanwhile
+    start_time = time.perf_counter()
+    query_embedding = encode_query(query_text)
+    encoded_time = time.perf_counter()
+    scores, indices = state.search(query_embedding, INITIAL_CANDIDATES, RESCORE_FACTOR)
+    searched_time = time.perf_counter()
+    ctx = QueryContext(query_text, state, query_embedding, scores, indices)
+
+    # Rerank with MMR
+    candidate_embs = state.embeddings[ctx.indices]
+    selected = mmr_rerank(ctx.query_embedding[0], candidate_embs)
+    ctx.final_indices = [ctx.indices[i] for i in selected]
+    ctx.final_scores = ctx.scores[selected]
+    ctx.timings = {
+        "encode": encoded_time - start_time,
+        "search": searched_time - encoded_time,
+        "mmr": time.perf_counter() - searched_time
+    }
+    return ctx
+
+def find_related_terms(ctx, k=3):
+    """Find related questions for fallback, reusing the request's top search results"""
+    faq_list = ctx.state.faq_list
     return "\n".join(
-        f"• {faq_list[i]['question']} (Source: {faq_list[i]['source']})"
-        for i in indices[0]
+        f"• {faq_list[i]['question']} (Source: {format_sources(faq_list[i])})"
+        for i in ctx.indices[:k]
     )
 
-def handle_unknown(query_text):
+def handle_unknown(ctx):
     """Improved unknown response handling"""
     return (
-        f"I'm unable to find a complete answer for '{query_text}'. Here are related topics:\n\n"
-        f"{find_related_terms(query_text)}\n\n"
+        f"I'm unable to find a complete answer for '{ctx.query_text}'. Here are related topics:\n\n"
+        f"{find_related_terms(ctx)}\n\n"
         "For further assistance:\n"
         "1. Visit our [contact page](https://www.safaricom.co.ke/media-center-landing/contact-us-media)\n"
         "2. Call customer care: *100#\n"
         "3. Visit a Safaricom shop"
     )
 
-def query_rag_enhanced(query_text):
-    """Main query processing with MMR"""
-    # Encode query and initial search
-    query_embedding = embedder.encode([query_text])
-    faiss.normalize_L2(query_embedding)
-    scores, indices = index.search(query_embedding.astype(np.float32), INITIAL_CANDIDATES)
-    
-    # Rerank with MMR
-    candidate_embs = embeddings[indices[0]]
-    selected = mmr_rerank(query_embedding[0], candidate_embs)
-    final_indices = [indices[0][i] for i in selected]
-    final_scores = scores[0][selected]
-    
-    # Confidence check
-    if np.max(final_scores) < CONFIDENCE_THRESHOLD:
-        return handle_unknown(query_text)
-    
+def build_prompt(ctx):
+    """Build the LLM prompt from the request's MMR-selected results"""
+    faq_list = ctx.state.faq_list
     # Build context from diverse results
     context = "\n\n".join(
-        f"Source: {faq_list[i]['source']}\n"
+        f"Source: {format_sources(faq_list[i])}\n"
         f"Q: {faq_list[i]['question']}\n"
         f"A: {faq_list[i]['answer']}"
-        for i in final_indices
+        for i in ctx.final_indices
     )
     
     # Enhanced prompt for complex questions
-    prompt = f"""Analyze this query for multiple components and answer using the context:
+    return f"""Analyze this query for multiple components and answer using the context:
 
     Context:
     {context}
 
-    Question: {query_text}
+    Question: {ctx.query_text}
 
     Structure your response with:
     1. Clear section headers for different topics
@@ -131,30 +192,150 @@ def query_rag_enhanced(query_text):
 
     If different sources conflict, note this and provide both perspectives.
     """
+
+def completion_params(prompt):
+    """Chat completion parameters shared by the blocking and streaming paths"""
+    return dict(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=500,
+        temperature=0.3
+    )
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+query_log = QueryLog(QUERY_LOG_DIR)
+
+def generate_answer(ctx, client):
+    """Blocking chat completion for a confident request; API errors propagate"""
+    response = client.chat.completions.create(**completion_params(build_prompt(ctx)))
+    return response.choices[0].message.content.strip()
+
+def query_rag_enhanced(query_text, client):
+    """Main query processing with MMR"""
+    cached = answer_cache.get(query_text, store.state.data_hash)
+    if cached is not None:
+        return cached
+
+    start_time = time.perf_counter()
+    ctx = retrieve(query_text)
+    
+    # Confidence check
+    if np.max(ctx.final_scores) < CONFIDENCE_THRESHOLD:
+        return handle_unknown(ctx)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
+        answer = generate_answer(ctx, client)
     except Exception as e:
         return f"API Error: {str(e)}"
+    answer_cache.put(query_text, ctx.state.data_hash, answer, time.perf_counter() - start_time)
+    return answer
+
+def warm_answer_cache(api_key):
+    """
+    Answers the examples, the hot queries and yesterday's most frequent questions ahead of traffic.
+    Answers that are cached, unexpired and generated from the current FAQ data are kept.
+    """
+    yesterday = date.today() - timedelta(days=1)
+    queries = {}
+    for query_text in EXAMPLES + HOT_QUERIES + query_log.top_queries(yesterday, WARM_TOP_N):
+        queries.setdefault(normalize_text(query_text), query_text)
+
+    client = get_client(api_key)
+    start_time = time.perf_counter()
+    warmed = 0
+    for query_text in queries.values():
+        if answer_cache.has(query_text, store.state.data_hash):
+            continue
+        ctx = retrieve(query_text)
+        if np.max(ctx.final_scores) < CONFIDENCE_THRESHOLD:
+            continue
+        try:
+            query_start = time.perf_counter()
+            answer = generate_answer(ctx, client)
+        except Exception as e:
+            print(f"Could not warm the answer cache for '{query_text[:60]}': {e}")
+            continue
+        answer_cache.put(query_text, ctx.state.data_hash, answer, time.perf_counter() - query_start)
+        warmed += 1
+    print(f"Warmed {warmed} of {len(queries)} answers in {time.perf_counter() - start_time:.1f}s")
+
+def keep_answer_cache_warm(api_key):
+    """Warms the cache at startup and again every WARM_INTERVAL, so hot answers are replaced soon
+    after they expire or a scraper delta changes the FAQ data"""
+    while True:
+        try:
+            warm_answer_cache(api_key)
+        except Exception as e:
+            print(f"Answer cache warming failed: {e}")
+        time.sleep(WARM_INTERVAL)
 
 # ------------------------------
-# Step 4: Gradio Interface
+# Step 3: Gradio Interface
 # ------------------------------
  
-def chatbot_interface(api_key, query_text):
+_client_pool = OrderedDict()
+_client_pool_lock = threading.Lock()
+
+def get_client(api_key, async_client=False):
+    """
+    Pooled OpenAI client for an API key. Clients are keyed by a hash of the key, so each user's
+    requests use their own key, and reused so their HTTP connections stay alive. The pool is an
+    LRU bounded by CLIENT_POOL_SIZE.
+    """
+    key = (hashlib.sha256(api_key.encode("utf-8")).hexdigest(), async_client)
+    with _client_pool_lock:
+        client = _client_pool.get(key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key) if async_client else OpenAI(api_key=api_key)
+            _client_pool[key] = client
+            if len(_client_pool) > CLIENT_POOL_SIZE:
+                # Not closed here: a request in another thread may still be using it
+                _client_pool.popitem(last=False)
+        else:
+            _client_pool.move_to_end(key)
+        return client
+
+async def chatbot_interface(api_key, query_text):
+    """Streams the answer into the response box as tokens arrive"""
     if not api_key.strip() or not query_text.strip():
-        return "❗ Please provide both API key and question"
-    
-    global client
-    client = OpenAI(api_key=api_key)
-    
-    return query_rag_enhanced(query_text)
+        yield "❗ Please provide both API key and question"
+        return
+
+    start_time = time.perf_counter()
+    query_log.log(query_text)  # queued for the writer thread, no disk I/O on the event loop
+    cached = answer_cache.get(query_text, store.state.data_hash)
+    if cached is not None:
+        print(f"Cache hit for '{query_text[:60]}': {answer_cache.stats()}")
+        yield cached
+        return
+
+    # Encoding and search are CPU-bound, so they run in a worker thread to keep the event loop free
+    ctx = await asyncio.to_thread(retrieve, query_text)
+
+    # Confidence check
+    if np.max(ctx.final_scores) < CONFIDENCE_THRESHOLD:
+        yield handle_unknown(ctx)
+        return
+
+    client = get_client(api_key.strip(), async_client=True)
+    answer = ""
+    try:
+        stream = await client.chat.completions.create(**completion_params(build_prompt(ctx)), stream=True)
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if not answer:
+                print(f"Time to first token: {time.perf_counter() - start_time:.2f}s for '{query_text[:60]}'")
+            answer += delta
+            yield answer
+    except Exception as e:
+        yield f"{answer}\n\nAPI Error: {str(e)}" if answer else f"API Error: {str(e)}"
+        return
+    if answer:
+        elapsed = time.perf_counter() - start_time
+        answer_cache.put(query_text, ctx.state.data_hash, answer, elapsed)
+        print(f"Answered '{query_text[:60]}' in {elapsed:.2f}s: {answer_cache.stats()}")
 
 iface = gr.Interface(
     fn=chatbot_interface,
@@ -171,12 +352,17 @@ iface = gr.Interface(
         "• Provides source references\n"
         "• Offers alternative solutions when uncertain"
     ),
-    examples=[
-        ["", "How do I register for MPESA and check my balance?"],
-        ["", "What's the difference between Lipa Na MPESA and Fuliza?"]
-    ],
+    examples=[["", example] for example in EXAMPLES],
     allow_flagging="never"
 )
 
 if __name__ == "__main__":
+    store.watch(DELTA_FILE, DELTA_POLL_SECONDS)
+    # Users bring their own keys, so warming needs a server-side key; without one the cache fills from traffic
+    warm_key = os.environ.get("OPENAI_API_KEY")
+    if warm_key:
+        threading.Thread(target=keep_answer_cache_warm, args=(warm_key,), name="answer-cache-warmer", daemon=True).start()
+    else:
+        print("OPENAI_API_KEY not set: answer cache starts cold")
+    iface.queue(default_concurrency_limit=GRADIO_CONCURRENCY)
     iface.launch(share=False)
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Compares the flat, int8 and binary index types from index_store.py on memory, search latency and
+recall@k against exact float search.
+
+Every index type goes through IndexState.search, the same call app.py makes, so quantized types
+include the float rescoring step. Recall@k is the overlap of each type's top k with the exact
+top k from a brute-force inner product over the float matrix.
+
+Usage:
+    python benchmark_index.py                         # faq_data.json, FAQ questions as queries
+    python benchmark_index.py --synthetic 100000      # offline: clustered random vectors, no model
+    python benchmark_index.py --rescore-factor 8 --k 5
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import faiss
+
+from index_store import INDEX_TYPES, IndexState, build_index, index_nbytes, load_faqs, faq_text
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if len(values) else 0.0
+
+def normalized(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def load_corpus(args):
+    """Returns (corpus vectors, query vectors), both normalized float32"""
+    if args.synthetic:
+        # Clustered vectors, so neighbours are meaningful the way sentence embeddings are
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(1, args.synthetic // 50), args.dim))
+        assignment = rng.integers(0, len(centers), size=args.synthetic)
+        corpus = normalized(centers[assignment] + 0.5 * rng.normal(size=(args.synthetic, args.dim)))
+        picks = rng.integers(0, args.synthetic, size=args.queries)
+        # Perturb corpus rows by noise with norm about args.noise (the rows have norm 1)
+        noise = args.noise * rng.normal(size=(args.queries, args.dim)) / np.sqrt(args.dim)
+        queries = normalized(corpus[picks] + noise)
+        return corpus, queries
+
+    from sentence_transformers import SentenceTransformer
+    embedder = SentenceTransformer(args.model)
+    with open(args.data, "r", encoding="utf-8") as f:
+        faq_list = load_faqs(json.load(f))
+    corpus = normalized(embedder.encode([faq_text(faq) for faq in faq_list], show_progress_bar=True))
+    questions = [faq["question"] for faq in faq_list][:args.queries]
+    queries = normalized(embedder.encode(questions))
+    return corpus, queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized FAQ index types against exact search")
+    parser.add_argument("--data", default="faq_data.json")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N clustered random vectors instead of the FAQ data")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--noise", type=float, default=0.8, help="Relative noise added to corpus rows to make synthetic queries")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20, help="Rows requested per search, as INITIAL_CANDIDATES in app.py")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = parser.parse_args()
+
+    corpus, queries = load_corpus(args)
+    rows = np.arange(len(corpus))
+    print(f"{len(corpus)} vectors of dim {corpus.shape[1]}, {len(queries)} queries")
+
+    # Ground truth: exact top k over the float matrix
+    exact = np.argsort(-(queries @ corpus.T), axis=1, kind="stable")[:, :args.k]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The float matrix is memory-mapped from disk, as in the app
+        matrix_path = os.path.join(tmp_dir, "embeddings.npy")
+        np.save(matrix_path, corpus)
+        embeddings = np.load(matrix_path, mmap_mode="r")
+
+        print(f"\n{'type':>7} {'index MB':>9} {'floats MB':>10} {'build s':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>9}")
+        for index_type in args.types:
+            start_time = time.perf_counter()
+            index = build_index(corpus, rows, index_type)
+            build_time = time.perf_counter() - start_time
+            state = IndexState([], embeddings, index, "", index_type)
+
+            state.search(queries[:1], args.candidates, args.rescore_factor)  # warm up
+            latencies, recalls = [], []
+            for i in range(len(queries)):
+                start_time = time.perf_counter()
+                _, found = state.search(queries[i:i + 1], args.candidates, args.rescore_factor)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                recalls.append(len(set(found[:args.k].tolist()) & set(exact[i].tolist())) / args.k)
+
+            # The flat index keeps its own in-memory float copy next to the memory-mapped matrix;
+            # quantized types only read the candidate rows from the map
+            index_mb = index_nbytes(index, index_type) / 1e6
+            floats_mb = corpus.nbytes / 1e6
+            print(
+                f"{index_type:>7} {index_mb:9.1f} {floats_mb:10.1f} {build_time:8.2f} "
+                f"{percentile(latencies, 50):8.3f} {percentile(latencies, 95):8.3f} "
+                f"{percentile(latencies, 99):8.3f} {np.mean(recalls):9.3f}"
+            )
+        del embeddings
+
+    print("\nindex MB is resident memory. floats MB is the memory-mapped matrix on disk, paged in on access.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Load test for the Safaricom RAG pipeline with the OpenAI endpoint replaced by a local stub.
+
+Replays a query set from N concurrent clients through the same functions the app uses (retrieve,
+then generate_answer for confident queries) and reports p50/p95/p99 latency per stage (encode,
+search, mmr, llm, total) and queries per second. The LLM is openai_stub.py with a configurable
+latency, so the run needs no network access or API key; the embedding model must already be in
+the local model cache and faq_data.json must exist. The answer cache is bypassed, so every query
+runs the full pipeline.
+
+Usage:
+    python benchmark_rag.py --clients 8 --llm-latency 0.8
+    python benchmark_rag.py --queries queries.json --repeat 3 --cold-encode
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from openai import OpenAI
+
+from openai_stub import start_stub_server
+
+STAGES = ["encode", "search", "mmr", "llm", "total"]
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if len(values) else 0.0
+
+def load_queries(args, app):
+    """Queries from a JSON list of strings, or FAQ questions sampled from the loaded index"""
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            return json.load(f)
+    questions = [faq["question"] for faq in app.store.state.faq_list if faq is not None]
+    random.Random(0).shuffle(questions)
+    return app.EXAMPLES + app.HOT_QUERIES + questions[:args.num_queries]
+
+def run_query(app, client, query_text):
+    """Runs one query through retrieval and, when confident, the LLM; returns its stage timings"""
+    start_time = time.perf_counter()
+    ctx = app.retrieve(query_text)
+    timings = dict(ctx.timings)
+    llm_start = time.perf_counter()
+    if np.max(ctx.final_scores) >= app.CONFIDENCE_THRESHOLD:
+        app.generate_answer(ctx, client)
+        timings["llm"] = time.perf_counter() - llm_start
+    timings["total"] = time.perf_counter() - start_time
+    return timings
+
+def report(results, wall_time, args):
+    print("\n=== Latency (ms) ===")
+    print(f"{'stage':>7} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage in STAGES:
+        values = [r[stage] * 1000 for r in results if stage in r]
+        print(
+            f"{stage:>7} {len(values):6d} {percentile(values, 50):9.1f} "
+            f"{percentile(values, 95):9.1f} {percentile(values, 99):9.1f}"
+        )
+
+    print("\n=== Throughput ===")
+    print(f"{len(results)} queries from {args.clients} concurrent clients in {wall_time:.2f} s")
+    print(f"QPS: {len(results) / wall_time:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Safaricom RAG pipeline against a local LLM stub")
+    parser.add_argument("--queries", help="JSON list of query strings (default: examples plus sampled FAQ questions)")
+    parser.add_argument("--num-queries", type=int, default=50, help="FAQ questions sampled when --queries is not given")
+    parser.add_argument("--clients", type=int, default=4, help="Number of concurrent clients")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each client replays the query set")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the stub takes per completion")
+    parser.add_argument("--cold-encode", action="store_true",
+                        help="Bypass the query embedding cache, so repeated queries are encoded every time")
+    args = parser.parse_args()
+
+    _, base_url = start_stub_server(latency=args.llm_latency)
+    print(f"OpenAI stub on {base_url} with {args.llm_latency}s latency")
+
+    # Importing the app loads the embedding model and the FAQ index, but does not launch Gradio
+    import app
+    if args.cold_encode:
+        app.encode_query = app.encode_query.__wrapped__
+    client = OpenAI(api_key="stub", base_url=base_url, max_retries=0)
+
+    queries = load_queries(args, app)
+    run_query(app, client, queries[0])  # warm up the model before timing
+
+    workload = queries * args.repeat * args.clients
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(lambda query_text: run_query(app, client, query_text), workload))
+    wall_time = time.perf_counter() - start_time
+
+    report(results, wall_time, args)
+
+if __name__ == "__main__":
+    main()
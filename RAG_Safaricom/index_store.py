@@ -0,0 +1,372 @@
+"""
+FAQ index persistence and incremental updates for the Safaricom Smart Assistant.
+
+The searchable corpus is held in an IndexState snapshot: the deduplicated FAQ entries, the
+normalized embedding matrix (memory-mapped from disk) and an ID-mapped FAISS index whose IDs
+are row numbers in that matrix. The index is either an exact float index ("flat") or a quantized
+one ("int8" scalar codes or "binary" sign bits) whose candidates are rescored against the
+memory-mapped float matrix, so only one full-precision copy of the vectors exists.
+
+Snapshots are never modified in place. Updates build a new snapshot and swap it in, so in-flight
+queries keep searching the one they started with. Each update only encodes the new rows, but
+still writes out the whole matrix and index, so it costs O(N) disk I/O for N rows.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+import faiss
+
+# ------------------------------
+# Loading and deduplication
+# ------------------------------
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different copies compare equal"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def dedup_key(question, answer):
+    return normalize_text(question) + "\n" + normalize_text(answer)
+
+def faq_text(faq):
+    """The text that gets embedded for an FAQ entry"""
+    return f"Q: {faq['question']}\nA: {faq['answer']}"
+
+def load_faqs(data):
+    """
+    Flatten {category_url: [faq, ...]} into unique FAQ entries. Exact copies and near-duplicates
+    that differ only in case, punctuation or whitespace are collapsed into one entry that keeps
+    the list of every source URL it appeared under.
+    """
+    entries = {}
+    total = 0
+    for url, faq_pairs in data.items():
+        for faq in faq_pairs:
+            total += 1
+            key = dedup_key(faq["question"], faq["answer"])
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = {
+                    "sources": [url],
+                    "question": faq["question"],
+                    "answer": faq["answer"]
+                }
+            elif url not in entry["sources"]:
+                entry["sources"].append(url)
+    print(f"Loaded {total} FAQ pairs, {len(entries)} unique after deduplication")
+    return list(entries.values())
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+TMP_GRACE_SECONDS = 3600  # Temporary cache files younger than this are never cleaned up
+
+def save_atomic(path, write):
+    """Writes through a temporary file and renames it into place, so a crash never leaves a partial cache."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"  # per process, so concurrent writers don't share a temp file
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+# ------------------------------
+# Index snapshots
+# ------------------------------
+INDEX_TYPES = ("flat", "int8", "binary")
+
+def binarize(vectors):
+    """Sign bit of every dimension, packed eight to a byte (768 dims -> 96 bytes)"""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+def build_index(vectors, rows, index_type="flat"):
+    """ID-mapped index of the given type, so rows can later be removed and added by ID"""
+    dim = vectors.shape[1]
+    if index_type == "binary":
+        index = faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(dim))
+    elif index_type == "int8":
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        ))
+        index.train(vectors)  # learns the per-dimension value range
+    elif index_type == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    add_rows(index, vectors, rows, index_type)
+    return index
+
+def add_rows(index, vectors, rows, index_type):
+    if len(rows):
+        codes = binarize(vectors) if index_type == "binary" else vectors
+        index.add_with_ids(codes, np.asarray(rows, dtype=np.int64))
+
+def copy_index(index, index_type):
+    # clone_binary_index does not support ID maps, so binary indexes are copied through bytes
+    if index_type == "binary":
+        return faiss.deserialize_index_binary(faiss.serialize_index_binary(index))
+    return faiss.clone_index(index)
+
+def write_index(index, path, index_type):
+    if index_type == "binary":
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+def read_index(path, index_type):
+    if index_type == "binary":
+        return faiss.read_index_binary(path)
+    return faiss.read_index(path)
+
+def index_nbytes(index, index_type):
+    """Serialized size of an index, which for these flat code stores is its size in memory"""
+    if index_type == "binary":
+        return len(faiss.serialize_index_binary(index))
+    return len(faiss.serialize_index(index))
+
+class IndexState:
+    """Immutable snapshot of the searchable corpus"""
+
+    def __init__(self, faq_list, embeddings, index, data_hash, index_type="flat"):
+        self.faq_list = faq_list      # row -> entry, or None for rows removed by a delta
+        self.embeddings = embeddings  # (rows, dim) normalized float32, memory-mapped
+        self.index = index            # FAISS index whose IDs are row numbers
+        self.data_hash = data_hash    # sha256 of the faq_data.json this snapshot reflects
+        self.index_type = index_type
+        self.keys = {
+            dedup_key(faq["question"], faq["answer"]): row
+            for row, faq in enumerate(faq_list) if faq is not None
+        }
+
+    def search(self, query_embedding, k, rescore_factor=4):
+        """
+        Top-k rows for a normalized (1, dim) query as (scores, rows), best first. Quantized indexes
+        return k * rescore_factor candidates, which are rescored with exact inner products against
+        the float matrix; only those rows are read from the memory map.
+        """
+        if self.index_type == "flat":
+            scores, rows = self.index.search(query_embedding, k)
+            found = rows[0] >= 0  # FAISS pads with -1 when fewer rows than requested are indexed
+            return scores[0][found], rows[0][found]
+
+        codes = binarize(query_embedding) if self.index_type == "binary" else query_embedding
+        _, rows = self.index.search(codes, k * rescore_factor)
+        rows = rows[0][rows[0] >= 0]
+        scores = self.embeddings[rows] @ query_embedding[0]
+        order = np.argsort(-scores, kind="stable")[:k]
+        return scores[order], rows[order]
+
+class IndexStore:
+    """
+    Owns the current IndexState: loads it from the on-disk cache (keyed by a hash of the data
+    file, the model name and the format version), rebuilds it when needed and applies scraper
+    deltas while the app is running.
+    """
+
+    def __init__(self, embedder, data_path, model_name, cache_dir, format_version, index_type="flat",
+                 compact_ratio=0.2):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+        self.embedder = embedder
+        self.data_path = data_path
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.format_version = format_version
+        self.index_type = index_type
+        self.compact_ratio = compact_ratio  # share of removed rows at which a delta compacts the matrix
+        self.state = None
+        self._update_lock = threading.Lock()  # one writer at a time; readers never take it
+
+    def cache_key(self, data_hash):
+        hasher = hashlib.sha256()
+        hasher.update(data_hash.encode("utf-8"))
+        hasher.update(self.model_name.encode("utf-8"))
+        hasher.update(str(self.format_version).encode("utf-8"))
+        hasher.update(self.index_type.encode("utf-8"))
+        return hasher.hexdigest()[:16]
+
+    def _paths(self, key):
+        return (
+            os.path.join(self.cache_dir, f"faqs_{key}.json"),
+            os.path.join(self.cache_dir, f"embeddings_{key}.npy"),
+            os.path.join(self.cache_dir, f"index_{key}.faiss"),
+        )
+
+    def encode(self, texts):
+        """Normalized float32 embeddings for a list of texts"""
+        if not texts:
+            dim = self.embedder.get_sentence_embedding_dimension()
+            return np.empty((0, dim), dtype=np.float32)
+        vectors = np.ascontiguousarray(
+            self.embedder.encode(texts, show_progress_bar=len(texts) > 100), dtype=np.float32
+        )
+        # Normalize embeddings for cosine similarity
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _persist(self, faq_list, vectors, index, data_hash):
+        """Saves a snapshot under its cache key, drops other keys and reloads it memory-mapped"""
+        key = self.cache_key(data_hash)
+        faqs_path, embeddings_path, index_path = self._paths(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        def write_faqs(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(faq_list, f, ensure_ascii=False)
+
+        def write_embeddings(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, vectors)
+
+        save_atomic(faqs_path, write_faqs)
+        save_atomic(embeddings_path, write_embeddings)
+        save_atomic(index_path, lambda tmp_path: write_index(index, tmp_path, self.index_type))
+
+        # Drop snapshots built from older data or models. Memory-mapped files that in-flight
+        # queries still use stay readable after unlinking.
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if key in name:
+                continue
+            try:
+                # A young temporary file may be another process's write in progress; only
+                # leftovers from crashed writers are removed
+                if name.endswith(".tmp") and time.time() - os.path.getmtime(path) < TMP_GRACE_SECONDS:
+                    continue
+                os.remove(path)
+            except OSError as e:
+                print(f"Could not remove stale cache file {name}: {e}")
+        return self._load_cached(key, data_hash)
+
+    def _load_cached(self, key, data_hash):
+        faqs_path, embeddings_path, index_path = self._paths(key)
+        with open(faqs_path, "r", encoding="utf-8") as f:
+            faq_list = json.load(f)
+        return IndexState(
+            faq_list, np.load(embeddings_path, mmap_mode="r"),
+            read_index(index_path, self.index_type), data_hash, self.index_type
+        )
+
+    def rebuild(self):
+        """Encodes the whole data file and builds a fresh, compact snapshot"""
+        data_hash = file_sha256(self.data_path)
+        with open(self.data_path, "r", encoding="utf-8") as f:
+            faq_list = load_faqs(json.load(f))
+        print(f"Encoding {len(faq_list)} FAQs")
+        vectors = self.encode([faq_text(faq) for faq in faq_list])
+        index = build_index(vectors, np.arange(len(faq_list)), self.index_type)
+        print(f"Built {self.index_type} index: {index_nbytes(index, self.index_type) / 1e6:.1f} MB")
+        return self._persist(faq_list, vectors, index, data_hash)
+
+    def load(self):
+        """Loads the snapshot for the current data file from the cache, building it if missing"""
+        data_hash = file_sha256(self.data_path)
+        key = self.cache_key(data_hash)
+        if all(os.path.exists(path) for path in self._paths(key)):
+            self.state = self._load_cached(key, data_hash)
+        else:
+            print(f"No cached index for {key}")
+            self.state = self.rebuild()
+        return self.state
+
+    def apply_delta(self, delta):
+        """
+        Applies a scraper delta ({"from_hash", "to_hash", "added", "changed", "removed"}) by
+        removing and adding only the affected rows, then swaps in the new snapshot. If the delta
+        was computed against different data than the current snapshot, a full rebuild is done
+        instead. Applying the same delta twice is a no-op.
+        """
+        with self._update_lock:
+            old = self.state
+            if delta["to_hash"] == old.data_hash:
+                print("Delta already applied")
+                return old
+            if delta["from_hash"] != old.data_hash:
+                print("Delta does not start from the loaded data: rebuilding the index")
+                self.state = self.rebuild()
+                return self.state
+
+            start_time = time.perf_counter()
+            faq_list = list(old.faq_list)
+            keys = dict(old.keys)
+            removed_rows = []
+
+            def detach(source, question, answer):
+                row = keys.get(dedup_key(question, answer))
+                if row is None or source not in faq_list[row]["sources"]:
+                    return
+                entry = dict(faq_list[row])
+                entry["sources"] = [url for url in entry["sources"] if url != source]
+                if entry["sources"]:
+                    faq_list[row] = entry
+                else:
+                    faq_list[row] = None  # tombstone: the row stays in the matrix but leaves the index
+                    del keys[dedup_key(question, answer)]
+                    removed_rows.append(row)
+
+            for record in delta["removed"]:
+                detach(record["source"], record["question"], record["answer"])
+            for record in delta["changed"]:
+                detach(record["source"], record["previous_question"], record["previous_answer"])
+
+            first_new_row = len(faq_list)
+            for record in delta["added"] + delta["changed"]:
+                key = dedup_key(record["question"], record["answer"])
+                row = keys.get(key)
+                if row is None:
+                    keys[key] = len(faq_list)
+                    faq_list.append({
+                        "sources": [record["source"]],
+                        "question": record["question"],
+                        "answer": record["answer"]
+                    })
+                elif record["source"] not in faq_list[row]["sources"]:
+                    entry = dict(faq_list[row])
+                    entry["sources"] = entry["sources"] + [record["source"]]
+                    faq_list[row] = entry
+
+            new_vectors = self.encode([faq_text(faq) for faq in faq_list[first_new_row:]])
+            vectors = np.concatenate([old.embeddings, new_vectors])
+            tombstones = sum(faq is None for faq in faq_list)
+            if tombstones > self.compact_ratio * len(faq_list):
+                # Too many removed rows: drop them from the matrix and renumber, instead of letting
+                # the matrix grow with every update
+                live_rows = [row for row, faq in enumerate(faq_list) if faq is not None]
+                faq_list = [faq_list[row] for row in live_rows]
+                vectors = vectors[live_rows]
+                index = build_index(vectors, np.arange(len(faq_list)), self.index_type)
+                print(f"Compacted the index: dropped {tombstones} removed rows")
+            else:
+                index = copy_index(old.index, self.index_type)
+                if removed_rows:
+                    index.remove_ids(np.asarray(removed_rows, dtype=np.int64))
+                add_rows(index, new_vectors, np.arange(first_new_row, len(faq_list)), self.index_type)
+
+            self.state = self._persist(faq_list, vectors, index, delta["to_hash"])
+            print(
+                f"Applied delta in {time.perf_counter() - start_time:.2f}s: "
+                f"{len(new_vectors)} rows added, {len(removed_rows)} removed"
+            )
+            return self.state
+
+    def watch(self, delta_path, poll_seconds=30):
+        """Polls for a scraper delta file in a daemon thread and applies it while the app keeps serving"""
+        def poll():
+            while True:
+                time.sleep(poll_seconds)
+                if not os.path.exists(delta_path):
+                    continue
+                try:
+                    with open(delta_path, "r", encoding="utf-8") as f:
+                        delta = json.load(f)
+                    self.apply_delta(delta)
+                    os.replace(delta_path, delta_path + ".applied")
+                except Exception as e:
+                    print(f"Could not apply {delta_path}: {e}")
+
+        thread = threading.Thread(target=poll, name="faq-delta-watcher", daemon=True)
+        thread.start()
+        return thread
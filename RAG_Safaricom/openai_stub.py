@@ -0,0 +1,121 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for load tests without network access
+or API cost.
+
+It answers POST /v1/chat/completions after a configurable latency, with or without streaming.
+Point a client at it with OpenAI(base_url="http://127.0.0.1:8001/v1", api_key="stub"). The
+openai package also reads OPENAI_BASE_URL, so the Gradio app can be run against it with:
+
+    python openai_stub.py --port 8001 --latency 0.8 &
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+"""
+import argparse
+import json
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER_WORDS = 120  # Words per answer, about the size of a real max_tokens=500 reply
+
+def stub_answer(messages):
+    question = messages[-1]["content"].rsplit("Question:", 1)[-1].split("\n", 1)[0].strip()
+    words = f"Stub answer for: {question}.".split()
+    return " ".join((words * (STUB_ANSWER_WORDS // len(words) + 1))[:STUB_ANSWER_WORDS])
+
+def make_handler(latency, token_latency):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the benchmark output
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; without this, Nagle's algorithm and
+            # delayed ACKs add ~40 ms to every reply and would be measured as LLM latency
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def handle(self):
+            try:
+                super().handle()
+            except (ConnectionResetError, BrokenPipeError):
+                pass  # client closed a kept-alive connection
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_event(self, payload):
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            chunk = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not self.path.endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            time.sleep(latency)
+            answer = stub_answer(request["messages"])
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": request.get("model", "stub")}
+
+            if not request.get("stream"):
+                self.send_json(200, dict(
+                    base,
+                    object="chat.completion",
+                    choices=[{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop"
+                    }],
+                    usage={"prompt_tokens": 0, "completion_tokens": len(answer.split()), "total_tokens": 0}
+                ))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in answer.split(" "):
+                self.send_event(dict(base, object="chat.completion.chunk", choices=[
+                    {"index": 0, "delta": {"content": word + " "}, "finish_reason": None}
+                ]))
+                time.sleep(token_latency)
+            self.send_event(dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": {}, "finish_reason": "stop"}
+            ]))
+            self.send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+def start_stub_server(port=0, latency=0.5, token_latency=0.0):
+    """Starts the stub in a daemon thread and returns (server, base_url); port 0 picks a free port"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, token_latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat completions stub")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first byte of each reply")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed words")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.latency, args.token_latency)
+    print(f"OpenAI stub listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
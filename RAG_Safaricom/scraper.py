@@ -1,56 +1,97 @@
-#Script  to scrape Safaricom FAQs and  answers  
+#Script  to scrape Safaricom FAQs and  answers
 
-import requests
+import argparse
+import asyncio
+import hashlib
 import json
-import time
+import os
 import random
+import re
+from urllib.parse import urljoin, urlparse
+
+import httpx
 from bs4 import BeautifulSoup
 
-def random_delay(min_seconds=1, max_seconds=3):
+# lxml is much faster than the built-in parser on large category pages; use it when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+LANDING_PAGE_URL = "https://www.safaricom.co.ke/media-center-landing/frequently-asked-questions"
+MAX_REQUESTS_PER_HOST = 2     # Polite cap on concurrent requests to one host
+
+async def random_delay(min_seconds=1, max_seconds=3):
     """Sleep for a random interval between min_seconds and max_seconds."""
     delay = random.uniform(min_seconds, max_seconds)
-    time.sleep(delay)
+    await asyncio.sleep(delay)
+
+class HostLimiter:
+    """Per-host semaphores, so concurrency against any single host stays bounded."""
+
+    def __init__(self, max_per_host=MAX_REQUESTS_PER_HOST):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semaphores[host]
 
-def get_category_urls(landing_url):
+async def fetch(client, limiter, url, min_delay=1, max_delay=3):
     """
-    Scrapes the landing page to collect all category URLs.
+    Fetches a page through the shared client. The host slot is held through the random delay
+    after the request, so each slot sends at most one request per delay interval.
+    """
+    async with limiter.for_url(url):
+        response = await client.get(url)
+        await random_delay(min_delay, max_delay)  # Random delay after request
+    response.raise_for_status()
+    return response.text
+
+def parse_category_urls(html, landing_url):
+    """
+    Collects all category URLs from the landing page.
     Adjust the CSS selector if needed.
     """
-    response = requests.get(landing_url)
-    random_delay()  # Random delay after request
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = BeautifulSoup(html, HTML_PARSER)
     # Select anchor tags that contain the FAQ category path
     category_links = soup.select("a[href*='/media-center-landing/frequently-asked-questions/']")
-    urls = set()
+    urls = []
     for link in category_links:
-        href = link.get("href")
         # Build absolute URL if it's relative
-        if href.startswith("/"):
-            href = "https://www.safaricom.co.ke" + href
-        urls.add(href)
-    return list(urls)
+        href = urljoin(landing_url, link.get("href"))
+        if href not in urls:
+            urls.append(href)
+    return urls
 
-def scrape_faq_pairs(category_url):
+def parse_faq_pairs(html, category_url):
     """
-    Scrapes the FAQ pairs from a given category page.
+    Extracts the FAQ pairs from a category page.
     It uses the <div class="card-header"> element to find the question and
     uses the 'href' attribute to locate the corresponding answer block.
-    Now extracts answer content from both paragraphs and list elements.
+    Extracts answer content from both paragraphs and list elements.
     """
-    response = requests.get(category_url)
-    random_delay()  # Random delay after request
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = BeautifulSoup(html, HTML_PARSER)
     faq_pairs = []
-    
+
+    # Map every div id to its element in one pass, instead of re-scanning the whole
+    # document for each question (which made large pages quadratic)
+    divs_by_id = {}
+    for div in soup.find_all('div', id=True):
+        divs_by_id.setdefault(div['id'], div)  # first match wins, like soup.find
+
     # Find all FAQ header items
     card_headers = soup.find_all('div', class_='card-header')
     print(f"Found {len(card_headers)} FAQ items on {category_url}")
-    
+
     for header in card_headers:
         # Extract the question text from the <a class="card-title">
         question_elem = header.find('a', class_='card-title')
         question_text = question_elem.get_text(strip=True) if question_elem else ''
-        
+
         # Use the href attribute to find the corresponding answer block.
         # Example: href="#collapse47" => target id is "collapse47"
         answer_ref = header.get('href', '')
@@ -58,44 +99,168 @@ def scrape_faq_pairs(category_url):
             answer_id = answer_ref[1:]
         else:
             answer_id = answer_ref
-        
-        answer_div = soup.find('div', id=answer_id)
+
+        answer_div = divs_by_id.get(answer_id)
         answer_text = ""
         if answer_div:
             # Use get_text with a newline separator to include text from paragraphs and list items.
             answer_text = answer_div.get_text(separator="\n", strip=True)
         else:
             print(f"Answer block not found for header with href: {answer_ref}")
-        
+
         if question_text and answer_text:
             faq_pairs.append({"question": question_text, "answer": answer_text})
-    
+
     return faq_pairs
 
-def main():
-    # Landing page with all FAQ categories
-    landing_page_url = "https://www.safaricom.co.ke/media-center-landing/frequently-asked-questions"
-    
-    # Get all category URLs
-    category_urls = get_category_urls(landing_page_url)
-    print("Found category pages:", category_urls)
-    
-    # Dictionary to hold all data: { category_url: [ {question, answer}, ... ] }
-    data = {}
-    
-    # Loop over each category page and scrape the FAQ pairs
-    for category_url in category_urls:
-        print("Scraping:", category_url)
-        faqs = scrape_faq_pairs(category_url)
-        data[category_url] = faqs
-        random_delay(2, 4)  # Slightly longer delay between category requests
-    
+async def scrape_category(client, limiter, category_url):
+    """The FAQ pairs of a category page, or None if it could not be fetched"""
+    print("Scraping:", category_url)
+    try:
+        html = await fetch(client, limiter, category_url, 2, 4)  # Slightly longer delay between category requests
+    except httpx.HTTPError as e:
+        print(f"Error fetching {category_url}: {e}")
+        return None
+    return parse_faq_pairs(html, category_url)
+
+async def scrape_all(landing_url=LANDING_PAGE_URL, max_per_host=MAX_REQUESTS_PER_HOST):
+    """
+    Scrapes every category linked from the landing page concurrently over one connection pool.
+
+    Returns:
+        A dictionary { category_url: [ {question, answer}, ... ] } in landing page order. A
+        category whose page could not be fetched maps to None instead of a list.
+    """
+    limiter = HostLimiter(max_per_host)
+    limits = httpx.Limits(max_connections=max_per_host * 4, max_keepalive_connections=max_per_host * 4)
+    async with httpx.AsyncClient(timeout=30.0, limits=limits, follow_redirects=True) as client:
+        landing_html = await fetch(client, limiter, landing_url)
+        category_urls = parse_category_urls(landing_html, landing_url)
+        print("Found category pages:", category_urls)
+
+        results = await asyncio.gather(
+            *(scrape_category(client, limiter, url) for url in category_urls)
+        )
+    return dict(zip(category_urls, results))
+
+def normalize_text(text):
+    """Same normalization as index_store.normalize_text, so record IDs survive cosmetic edits"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def faq_record_id(category_url, question):
+    """
+    Stable ID of an FAQ record: its category page plus its normalized question. An edited answer
+    keeps the ID (and shows up as changed); an edited question is a removal plus an addition.
+    """
+    key = category_url + "\n" + normalize_text(question)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def faq_records(data):
+    """{record_id: {source, question, answer}} for a { category_url: [faq, ...] } dictionary"""
+    records = {}
+    for url, faq_pairs in data.items():
+        for faq in faq_pairs:
+            records[faq_record_id(url, faq["question"])] = {
+                "source": url,
+                "question": faq["question"],
+                "answer": faq["answer"]
+            }
+    return records
+
+def compute_delta(old_data, new_data, from_hash, to_hash):
+    """
+    Added, changed and removed FAQ records between two scrapes. Changed records carry their
+    previous question and answer so the app can find the row to replace. from_hash and to_hash
+    are the sha256 of the data files before and after, so the app only applies a delta on top
+    of the data it was built from.
+    """
+    old_records = faq_records(old_data)
+    new_records = faq_records(new_data)
+    added, changed, removed = [], [], []
+    for record_id, record in new_records.items():
+        previous = old_records.get(record_id)
+        if previous is None:
+            added.append(dict(record, id=record_id))
+        elif (previous["question"], previous["answer"]) != (record["question"], record["answer"]):
+            changed.append(dict(record, id=record_id,
+                                previous_question=previous["question"],
+                                previous_answer=previous["answer"]))
+    for record_id, record in old_records.items():
+        if record_id not in new_records:
+            removed.append(dict(record, id=record_id))
+    return {
+        "from_hash": from_hash,
+        "to_hash": to_hash,
+        "added": added,
+        "changed": changed,
+        "removed": removed
+    }
+
+def write_atomic(path, payload):
+    """Writes bytes through a temporary file and renames it into place"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_scrape(data, output_path, delta_path):
+    """
+    Writes a scrape to output_path and, if an earlier output changed, the delta to delta_path.
+
+    Categories that failed to fetch (None in `data`) keep their FAQs from the earlier output, so
+    a timeout or server error is never mistaken for every FAQ of the category being removed.
+
+    Returns:
+        The delta, or None if none was written.
+    """
+    old_data, old_hash = {}, None
+    if os.path.exists(output_path):
+        with open(output_path, "rb") as f:
+            old_payload = f.read()
+        old_data = json.loads(old_payload)
+        old_hash = hashlib.sha256(old_payload).hexdigest()
+
+    failed = [url for url, faq_pairs in data.items() if faq_pairs is None]
+    if failed:
+        print(f"Keeping the previous FAQs of {len(failed)} categories that failed to fetch: {failed}")
+    data = {
+        url: old_data.get(url, []) if faq_pairs is None else faq_pairs
+        for url, faq_pairs in data.items()
+    }
+
     # Save the collected data into a JSON file
-    output_file = "faq_data.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    
-    print("FAQ data saved to", output_file)
+    payload = json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+    new_hash = hashlib.sha256(payload).hexdigest()
+    write_atomic(output_path, payload)
+    print("FAQ data saved to", output_path)
+
+    if old_hash is None or old_hash == new_hash:
+        return None
+    delta = compute_delta(old_data, data, old_hash, new_hash)
+    write_atomic(delta_path, json.dumps(delta, ensure_ascii=False, indent=4).encode("utf-8"))
+    print(
+        f"Delta saved to {delta_path}: {len(delta['added'])} added, "
+        f"{len(delta['changed'])} changed, {len(delta['removed'])} removed"
+    )
+    return delta
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape the Safaricom FAQ pages")
+    parser.add_argument("--url", default=LANDING_PAGE_URL,
+                        help="Landing page (point it at a local server of saved HTML fixtures for testing)")
+    parser.add_argument("--max-per-host", type=int, default=MAX_REQUESTS_PER_HOST,
+                        help="Maximum concurrent requests to one host")
+    parser.add_argument("--output", default="faq_data.json")
+    parser.add_argument("--delta", default="faq_delta.json",
+                        help="Where to write added/changed/removed records relative to the previous output")
+    args = parser.parse_args()
+
+    # Dictionary to hold all data: { category_url: [ {question, answer}, ... ] or None if it failed }
+    data = asyncio.run(scrape_all(args.url, args.max_per_host))
+
+    save_scrape(data, args.output, args.delta)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,127 @@
+"""
+Tests for applying scraper deltas to the persisted FAQ index.
+
+Run from RAG_Safaricom with: python -m unittest discover tests
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper  # noqa: E402
+from index_store import INDEX_TYPES, IndexStore, faq_text  # noqa: E402
+
+class FakeEmbedder:
+    """Deterministic random vector per text, so no model is needed; counts what gets encoded"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return 32
+
+    def encode(self, texts, show_progress_bar=False):
+        self.encoded.extend(texts)
+        seeds = [int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16) for text in texts]
+        return np.stack([np.random.default_rng(seed).normal(size=32) for seed in seeds])
+
+def faqs(*pairs):
+    return [{"question": question, "answer": answer} for question, answer in pairs]
+
+class ApplyDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reset()
+
+    def reset(self):
+        """Starts from the original data with an empty index cache"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.data_path = os.path.join(self.tmp_dir.name, "faq_data.json")
+        self.cache_dir = os.path.join(self.tmp_dir.name, "index_cache")
+        self.data = {
+            "mpesa": faqs(("Register?", "Visit a shop."), ("Balance?", "Dial *334#."),
+                          ("Reverse?", "Send to 456."), ("Limits?", "KES 250,000.")),
+            "fuliza": faqs(("Register?", "Visit a shop."), ("What is Fuliza?", "An overdraft.")),
+        }
+        self.data_hash = self.write_data(self.data)
+
+    def write_data(self, data):
+        payload = json.dumps(data, indent=4).encode("utf-8")
+        with open(self.data_path, "wb") as f:
+            f.write(payload)
+        return hashlib.sha256(payload).hexdigest()
+
+    def open_store(self, index_type="flat", compact_ratio=0.2):
+        embedder = FakeEmbedder()
+        store = IndexStore(embedder, self.data_path, "fake", self.cache_dir, 1, index_type, compact_ratio)
+        store.load()
+        return store, embedder
+
+    def update(self, store, new_data):
+        delta = scraper.compute_delta(self.data, new_data, self.data_hash, self.write_data(new_data))
+        self.data, self.data_hash = new_data, delta["to_hash"]
+        return store.apply_delta(delta)
+
+    def top_question(self, store, faq):
+        query = FakeEmbedder().encode([faq_text(faq)]).astype(np.float32)
+        query /= np.linalg.norm(query)
+        _, rows = store.state.search(query, 1)
+        return store.state.faq_list[rows[0]]["question"]
+
+    def test_only_new_rows_are_encoded(self):
+        for index_type in INDEX_TYPES:
+            with self.subTest(index_type=index_type):
+                self.reset()
+                store, embedder = self.open_store(index_type, compact_ratio=1.0)
+                embedder.encoded.clear()
+                new_data = json.loads(json.dumps(self.data))
+                new_data["mpesa"][1]["answer"] = "Dial *334# or use the app."
+                new_data["mpesa"].append({"question": "PIN?", "answer": "Dial *234#."})
+                state = self.update(store, new_data)
+
+                self.assertEqual(len(embedder.encoded), 2)
+                self.assertEqual(state.index.ntotal, 6)
+                self.assertEqual(self.top_question(store, new_data["mpesa"][4]), "PIN?")
+                self.assertIsNone(state.faq_list[1])  # the old balance answer is a tombstone
+
+    def test_reapplying_a_delta_is_a_no_op(self):
+        store, _ = self.open_store()
+        new_data = dict(self.data, fuliza=self.data["fuliza"][:1])
+        delta = scraper.compute_delta(self.data, new_data, self.data_hash, self.write_data(new_data))
+        state = store.apply_delta(delta)
+        self.assertIs(store.apply_delta(delta), state)
+
+    def test_removed_rows_are_compacted_past_the_threshold(self):
+        store, _ = self.open_store(compact_ratio=0.2)
+        new_data = json.loads(json.dumps(self.data))
+        new_data["mpesa"] = new_data["mpesa"][:1]  # remove three of five unique FAQs
+        state = self.update(store, new_data)
+
+        self.assertEqual(len(state.faq_list), 2)
+        self.assertNotIn(None, state.faq_list)
+        self.assertEqual(state.embeddings.shape[0], 2)
+        self.assertEqual(state.index.ntotal, 2)
+        self.assertEqual(self.top_question(store, new_data["fuliza"][1]), "What is Fuliza?")
+        self.assertEqual(state.faq_list[0]["sources"], ["mpesa", "fuliza"])
+
+    def test_restart_loads_the_updated_snapshot(self):
+        store, _ = self.open_store()
+        new_data = dict(self.data, fuliza=self.data["fuliza"][:1])
+        state = self.update(store, new_data)
+
+        reopened, embedder = self.open_store()
+        self.assertEqual(embedder.encoded, [])  # served from the cache, nothing re-encoded
+        self.assertEqual(reopened.state.faq_list, state.faq_list)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), sorted(
+            os.path.basename(path) for path in store._paths(store.cache_key(state.data_hash))
+        ))
+
+if __name__ == "__main__":
+    unittest.main()
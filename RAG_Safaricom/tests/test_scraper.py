@@ -0,0 +1,159 @@
+"""
+Tests for scraper.py against saved FAQ pages served from a local HTTP server.
+
+Run from RAG_Safaricom with: python -m unittest discover tests
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FAQ_PATH = "/media-center-landing/frequently-asked-questions"
+
+# URL path -> saved page
+ROUTES = {
+    FAQ_PATH: "landing.html",
+    FAQ_PATH + "/mpesa": "mpesa.html",
+    FAQ_PATH + "/fuliza": "fuliza.html",
+}
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+async def no_delay(min_seconds=1, max_seconds=3):
+    pass
+
+class FixtureServer:
+    """Serves ROUTES on an ephemeral port, holding each response briefly to record peak concurrency"""
+
+    def __init__(self, response_delay=0.05):
+        self.requests = []
+        self.failing = set()  # URL paths answered with 503
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        lock = threading.Lock()
+        fixture_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with lock:
+                    fixture_server.requests.append(self.path)
+                    fixture_server.in_flight += 1
+                    fixture_server.peak_in_flight = max(fixture_server.peak_in_flight, fixture_server.in_flight)
+                try:
+                    time.sleep(response_delay)
+                    if self.path in fixture_server.failing:
+                        self.send_error(503)
+                        return
+                    if self.path not in ROUTES:
+                        self.send_error(404)
+                        return
+                    body = read_fixture(ROUTES[self.path]).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with lock:
+                        fixture_server.in_flight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class ParseTest(unittest.TestCase):
+
+    def test_parse_category_urls(self):
+        landing_url = "http://example.test" + FAQ_PATH
+        self.assertEqual(
+            scraper.parse_category_urls(read_fixture("landing.html"), landing_url),
+            ["http://example.test" + FAQ_PATH + "/mpesa", "http://example.test" + FAQ_PATH + "/fuliza"],
+        )
+
+    def test_parse_faq_pairs(self):
+        self.assertEqual(
+            scraper.parse_faq_pairs(read_fixture("mpesa.html"), "mpesa"),
+            [
+                {"question": "How do I register for M-PESA?",
+                 "answer": "Visit any Safaricom shop or M-PESA agent with your original ID."},
+                {"question": "How do I check my M-PESA balance?",
+                 "answer": "Use any of these options:\nDial *334#\nOpen the M-PESA App"},
+            ],
+        )
+
+    def test_parsers_agree(self):
+        # lxml, when installed, must give the same pairs as the built-in parser
+        html = read_fixture("mpesa.html")
+        with mock.patch.object(scraper, "HTML_PARSER", "html.parser"):
+            expected = scraper.parse_faq_pairs(html, "mpesa")
+        self.assertEqual(scraper.parse_faq_pairs(html, "mpesa"), expected)
+
+class ScrapeAllTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FixtureServer()
+        self.addCleanup(self.server.close)
+        # The polite random delays would only slow the test down
+        patcher = mock.patch.object(scraper, "random_delay", no_delay)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scrapes_every_category(self):
+        landing_url = self.server.base_url + FAQ_PATH
+        data = asyncio.run(scraper.scrape_all(landing_url, max_per_host=2))
+
+        # Categories come back in landing page order, however the fetches interleave
+        self.assertEqual(list(data), [landing_url + "/mpesa", landing_url + "/fuliza"])
+        self.assertEqual(sum(len(pairs) for pairs in data.values()), 3)
+        self.assertEqual(data[landing_url + "/fuliza"][0]["question"], "What is Fuliza?")
+        self.assertEqual(sorted(self.server.requests), sorted(ROUTES))  # each page fetched once
+
+    def test_respects_the_per_host_limit(self):
+        asyncio.run(scraper.scrape_all(self.server.base_url + FAQ_PATH, max_per_host=1))
+        self.assertEqual(self.server.peak_in_flight, 1)
+
+    def test_failed_category_is_not_removed(self):
+        landing_url = self.server.base_url + FAQ_PATH
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        output_path = os.path.join(tmp_dir.name, "faq_data.json")
+        delta_path = os.path.join(tmp_dir.name, "faq_delta.json")
+
+        first = asyncio.run(scraper.scrape_all(landing_url))
+        first[landing_url + "/mpesa"].pop()  # so the rescrape has a change to report
+        scraper.save_scrape(first, output_path, delta_path)
+
+        self.server.failing.add(FAQ_PATH + "/fuliza")
+        second = asyncio.run(scraper.scrape_all(landing_url))
+        self.assertIsNone(second[landing_url + "/fuliza"])
+        delta = scraper.save_scrape(second, output_path, delta_path)
+
+        self.assertEqual(len(delta["added"]), 1)
+        self.assertEqual(delta["removed"], [])
+        with open(output_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        self.assertEqual(saved[landing_url + "/fuliza"], first[landing_url + "/fuliza"])
+        self.assertEqual(list(saved), list(first))  # landing page order is kept
+
+if __name__ == "__main__":
+    unittest.main()